@@ -1,7 +1,8 @@
 import os
-from openai import OpenAI
+from openai import APITimeoutError, OpenAI
 from typing import  Dict
 import time
+from utils.token_budget import TokenBudget, TokenEstimator
 
 class BaseAgent:
     """
@@ -16,31 +17,50 @@ class BaseAgent:
         
         self.client = OpenAI(
             api_key=os.getenv("DASHSCOPE_API_KEY"),
-            base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
+            base_url=os.getenv("DASHSCOPE_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1"),
         )
+        # token记账与预算，未指定时只记账不限制
+        self.budget = config.get("token_budget") or TokenBudget()
     
-    def llm_api(self, prompt: str, max_retries=3, delay=1) -> str:
+    def llm_api(self, prompt: str, max_retries=3, delay=1, max_tokens=1000, min_tokens=200, stage=None,
+                allowance=None) -> str:
         """
         llm大模型API的调用，
         此处我们将温度调成0.1让模型尽可能生成一个相对稳定的内容
+        调用前按离线估算向预算预留token，预算紧张或超出本次份额allowance时自动降低输出上限，
+        连min_tokens都负担不起时抛出BudgetExceeded（调用不会发出）
         """
-        for attempt in range(max_retries):
-            try:
-                response = self.client.chat.completions.create(
-                    model=self.config.get("model", "qwen-turbo"),
-                    messages=[
-                        {"role": "system", "content": "你是一位辩论赛选手"},
-                        {"role": "user", "content": prompt},
-                    ],
-                    temperature=0.1,
-                    max_tokens=1000
-                )
-                return response.choices[0].message.content.strip()
-            except Exception as e:
-                print(f"API调用失败 ({attempt+1}/{max_retries}): {str(e)}")
-                if attempt < max_retries - 1:
-                    time.sleep(delay)
-        return "API调用失败，请检查网络连接和API密钥"
+        model = self.config.get("model", "qwen-turbo")
+        messages = [
+            {"role": "system", "content": "你是一位辩论赛选手"},
+            {"role": "user", "content": prompt},
+        ]
+        prompt_tokens = TokenEstimator.estimate_messages(messages)
+        max_tokens = self.budget.acquire(prompt_tokens, max_tokens, min_tokens, allowance)
+
+        used = (0, 0)
+        try:
+            for attempt in range(max_retries):
+                try:
+                    response = self.client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        temperature=0.1,
+                        max_tokens=max_tokens
+                    )
+                    content = response.choices[0].message.content.strip()
+                    used = TokenEstimator.from_usage(getattr(response, "usage", None), prompt_tokens, content)
+                    return content
+                except Exception as e:
+                    print(f"API调用失败 ({attempt+1}/{max_retries}): {str(e)}")
+                    if isinstance(e, APITimeoutError):
+                        # 超时的请求服务端可能已经处理，按预留量估算记账
+                        self.budget.record(self.agent_id, stage, model, prompt_tokens, max_tokens)
+                    if attempt < max_retries - 1:
+                        time.sleep(delay)
+            return "API调用失败，请检查网络连接和API密钥"
+        finally:
+            self.budget.release(prompt_tokens + max_tokens, self.agent_id, stage, model, *used)
 
     def generate_response(self, context: Dict) -> str:
         """
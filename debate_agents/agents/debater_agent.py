@@ -1,15 +1,60 @@
 # debater_agent.py
 
+from concurrent.futures import ThreadPoolExecutor
 from agents.base_agent import BaseAgent
 from utils.speech_handler import SpeechHandler
+from utils.token_budget import BudgetExceeded
+
+FAILED_OUTPUTS = {"论点生成失败", "API调用失败，请检查网络连接和API密钥"}
+
+# 预算不足时依次缩短引用的历史条数
+HISTORY_WINDOWS = (3, 1, 0)
+
+# 一次发言最少的输出token
+MIN_SPEECH_TOKENS = 200
+
+# 草稿补写反驳：输出上限与引用对方发言的字数
+REBUTTAL_TOKENS = 150
+REBUTTAL_EXCERPT = 200
+
 
 class DebaterAgent(BaseAgent):
     def __init__(self, agent_id: str, role: str, config: dict):
         super().__init__(agent_id, role, config)
         self.max_words = config.get("max_speech_length", 1000)
+        # 预生成草稿模式：上一位辩手开始发言时就在后台起草，轮到自己时只针对对方新发言补写简短反驳
+        self.speculative = config.get("speculative_drafts", False)
+        self.max_draft_lag = config.get("max_draft_lag", 1)
+        self._executor = ThreadPoolExecutor(max_workers=1) if self.speculative else None
+        self._draft = None
+
+    def start_draft(self, context: dict):
+        """
+        以当前历史的快照在后台起草下一次发言
+        """
+        if not self.speculative:
+            return
+        self.discard_draft()
+        history = list(context.get("speech_history", []))
+        draft_context = dict(context, speech_history=history)
+        self._draft = {
+            "future": self._executor.submit(self._generate_claim, draft_context),
+            "stage": context.get("current_stage"),
+            "history_len": len(history)
+        }
+
+    def discard_draft(self):
+        """
+        丢弃尚未使用的草稿
+        """
+        if self._draft is not None:
+            self._draft["future"].cancel()
+            self._draft = None
 
     def generate_response(self, context: dict) -> dict:
-        original_argument = self._generate_claim(context)
+        original_argument = self._speculative_claim(context) if self.speculative else None
+        if original_argument is None:
+            original_argument = self._generate_claim(context)
         truncated_content = SpeechHandler.limit_words(original_argument, self.max_words)
         
         return {
@@ -22,10 +67,32 @@ class DebaterAgent(BaseAgent):
 
     def _generate_claim(self, context: dict) -> str:
         '''
+        本轮份额（token_allowance）不足以覆盖完整提示词时，逐步缩短历史摘要后重试；
+        份额内连不带历史的提示词都放不下时，最后用剩余预算以最短输出尝试一次
+        '''
+        allowance = context.get("token_allowance")
+        attempts = [(window, allowance, 1000) for window in HISTORY_WINDOWS]
+        if allowance is not None:
+            attempts.append((HISTORY_WINDOWS[-1], None, MIN_SPEECH_TOKENS))
+        for window, share, max_tokens in attempts:
+            prompt = self._build_claim_prompt(context, window)
+            try:
+                response = self.llm_api(prompt, max_tokens=max_tokens, min_tokens=MIN_SPEECH_TOKENS,
+                                        stage=context.get("current_stage"), allowance=share)
+                return response.strip()
+            except BudgetExceeded as e:
+                print(f"预算不足，缩短历史摘要 ({window}条): {str(e)}")
+            except Exception as e:
+                print(f"论点生成失败: {str(e)}")
+                return "论点生成失败"
+        return "论点生成失败"
+
+    def _build_claim_prompt(self, context: dict, window: int = 3) -> str:
         '''
-        history_summary = self._summarize_history(context.get("speech_history", []))
+        '''
+        history_summary = self._summarize_history(context.get("speech_history", []), window)
         
-        prompt = f"""
+        return f"""
     你作为{self.role}方辩手，当前辩题：{context['topic']}。\n
     
     ### 以下是其他辩手的历史发言记录\n
@@ -48,21 +115,78 @@ class DebaterAgent(BaseAgent):
     ###再次强调，你是一位辩手，不要机械式地陈列观点，而是组织成自然的语言表述出来，不要简单陈列观点！！！\n
     ###你的内容只需要包含你发言稿的部分！不需要再加入你分析的过程！！！
         """
+    
+    def _speculative_claim(self, context: dict):
+        """
+        使用后台草稿：草稿之后新增的辩手发言不超过max_draft_lag条时使用草稿（必要时补写反驳），
+        草稿过期（跨阶段、落后太多或生成失败）时返回None，由调用方完整生成
+        """
+        draft, self._draft = self._draft, None
+        if draft is None:
+            return None
+        if draft["stage"] != context.get("current_stage"):
+            draft["future"].cancel()
+            return None
+
+        new_items = context.get("speech_history", [])[draft["history_len"]:]
+        new_speeches = [item for item in new_items if item.get("type") == "argument"]
+        if len(new_speeches) > self.max_draft_lag:
+            draft["future"].cancel()
+            return None
+
         try:
-            response = self.llm_api(prompt)
-            return response.strip()
+            draft_text = draft["future"].result()
         except Exception as e:
-            print(f"论点生成失败: {str(e)}")
-            return "论点生成失败"
-    
-    def _summarize_history(self, history: list) -> str:
+            print(f"草稿生成失败: {str(e)}")
+            return None
+        if draft_text in FAILED_OUTPUTS:
+            return None
+        if not new_speeches:
+            return draft_text
+
+        return self._refine_draft(draft_text, new_speeches, context)
+
+    def _refine_draft(self, draft: str, new_speeches: list, context: dict):
+        """
+        草稿之后只有队友发言时原样使用草稿；有对方新发言时，
+        只针对其节选补写一段简短反驳（输出上限REBUTTAL_TOKENS）并接在草稿之前
+        """
+        team = self.role[:2]
+        rebuttals = [item for item in new_speeches if item.get("role", "")[:2] != team]
+        if not rebuttals:
+            return draft
+
+        latest = "\n".join(
+            f"{item.get('role', '辩手')}: {item.get('content', '')[:REBUTTAL_EXCERPT]}" for item in rebuttals
+        )
+        prompt = f"""
+    你作为{self.role}方辩手，当前辩题：{context['topic']}。\n
+
+    ### 对方刚刚的发言（节选）\n
+    {latest}\n
+
+    ### 你的任务：
+    写一段不超过100字的反驳，直接指出上面发言的漏洞。这段话会放在你已准备好的发言稿之前，发言稿开头是：{draft[:80]}\n
+    ###你的内容只需要包含这段反驳！不需要再加入你分析的过程！！！
+        """
+        try:
+            rebuttal = self.llm_api(prompt, max_tokens=REBUTTAL_TOKENS, min_tokens=60,
+                                    stage=context.get("current_stage"),
+                                    allowance=context.get("token_allowance")).strip()
+        except BudgetExceeded:
+            return draft
+        if rebuttal in FAILED_OUTPUTS:
+            return draft
+        return f"{rebuttal}\n{draft}"
+
+    def _summarize_history(self, history: list, window: int = 3) -> str:
         """
         综合发言历史
         """
-        if not history:
+        if not history or window <= 0:
             return "暂无历史发言"
             
         return "\n".join(
             f"{idx+1}. {item.get('role', '辩手')}: {item.get('content', '')[:80]}"
-            for idx, item in enumerate(history[-3:])
+            for idx, item in enumerate(history[-window:])
         )
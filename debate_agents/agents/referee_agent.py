@@ -1,13 +1,33 @@
 # referee_agent.py
 
+import statistics
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from agents.base_agent import BaseAgent
 from utils.scoring_system import ScoringSystem
+from utils.embedding_relevance import EmbeddingRelevance
+from utils.token_budget import BudgetExceeded
 
 
 class RefereeAgent(BaseAgent):
     def __init__(self, agent_id: str, role: str, config: dict,llm_use:bool = False):
         super().__init__(agent_id, role, config)
         self.llm_use=llm_use
+        # 可选的向量相关性引擎，每场辩论（每个裁判实例）独立缓存
+        if config.get("relevance_engine") == "embedding":
+            self.relevance_engine = EmbeddingRelevance()
+        else:
+            self.relevance_engine = None
+
+        # 评审团模式：多个裁判（"heuristic"或模型名）并发评同一段发言
+        self.panel = list(config.get("judge_panel") or [])
+        self.panel_aggregate = config.get("panel_aggregate", "median")
+        self.panel_deadline = config.get("panel_deadline", 30)
+        self.panel_quorum = min(config.get("panel_quorum") or len(self.panel) // 2 + 1, len(self.panel))
+        # 只有LLM裁判进线程池；启发式裁判在调用线程内直接评分，不会排在慢请求之后。
+        # LLM裁判单次请求以截止时间为客户端超时，超时的线程随之结束，线程池不会被占满
+        llm_judges = [judge for judge in self.panel if judge != "heuristic"]
+        self._panel_executor = ThreadPoolExecutor(max_workers=len(llm_judges) * 2) if llm_judges else None
     
     def generate_response(self, context: dict) -> dict:
         current_speech = context["current_speech"]
@@ -18,27 +38,152 @@ class RefereeAgent(BaseAgent):
             "role": current_speech.get("role", "辩手"),
             "type": "argument"
         }
-        if self.llm_use:
-            scores = ScoringSystem.llm_calculate_dimension_scores(
-                speech=scoring_speech,
-                history=context["speech_history"],
-                topic=context["topic"]
-            )
+        # 与已评分的发言几乎相同时直接复用其评分（可来自批量任务中的其他场次）；
+        # repetition 只在与本场之前的发言重复时给出，此时扣重复分
+        repetition = context.get("repetition")
+        cached_scores = context.get("cached_scores")
+        panel = None
+        if cached_scores is not None:
+            scores = dict(cached_scores)
+        elif self.panel:
+            scores, panel = self._panel_scores(scoring_speech, context)
         else:
-            scores = ScoringSystem.calculate_dimension_scores(
-                speech=scoring_speech,
-                history=context["speech_history"],
-                topic=context["topic"]
+            scores = self._judge("qwen-max" if self.llm_use else "heuristic", scoring_speech, context)
+
+        unpenalized_scores = scores
+        if repetition:
+            scores = ScoringSystem.apply_repetition_penalty(
+                scores, repetition["similarity"], self.config.get("repetition_strength", 0.5)
             )
 
         comment = self._generate_comment(scores)
-        
-        return {
+
+        judgment = {
             "agent_id": self.agent_id,
             "type": "judgment",
             "scores": scores,
             "comment": comment
         }
+        if cached_scores is not None:
+            judgment["reused"] = True
+        if panel is not None:
+            judgment["panel"] = panel
+        if repetition:
+            judgment["repetition"] = {
+                "similarity": repetition["similarity"],
+                "matches": repetition["matches"],
+                "unpenalized_scores": unpenalized_scores
+            }
+        return judgment
+
+    def _judge(self, judge: str, scoring_speech: dict, context: dict, timeout: float = None) -> dict:
+        """
+        单个裁判评分：judge 为 "heuristic" 或模型名
+        :param timeout: LLM裁判的请求超时（秒），给出时（评审团模式）只尝试一次，
+                        请求失败或预算不足都抛出异常，由评审团记为未完成评分
+        """
+        if judge != "heuristic":
+            try:
+                return ScoringSystem.llm_calculate_dimension_scores(
+                    speech=scoring_speech,
+                    history=context["speech_history"],
+                    topic=context["topic"],
+                    budget=self.budget,
+                    agent_id=self.agent_id,
+                    usage_stage=context.get("current_stage"),
+                    model=judge,
+                    timeout=timeout,
+                    max_retries=1 if timeout is not None else 3,
+                    strict=timeout is not None,
+                    allowance=context.get("token_allowance")
+                )
+            except BudgetExceeded as e:
+                if timeout is not None:
+                    raise
+                # 单裁判模式下预算不足时退回启发式裁判
+                print(f"预算不足，改用启发式评分: {str(e)}")
+        return ScoringSystem.calculate_dimension_scores(
+            speech=scoring_speech,
+            history=context["speech_history"],
+            topic=context["topic"],
+            relevance_engine=self.relevance_engine
+        )
+
+    def _panel_scores(self, scoring_speech: dict, context: dict) -> tuple:
+        """
+        评审团并发评分，凑齐法定人数（或到达截止时间）即返回，未返回的裁判被丢弃
+        :return: (汇总分数, 评审团明细)
+        """
+        deadline = time.monotonic() + self.panel_deadline
+        futures = {
+            self._panel_executor.submit(self._judge, judge, scoring_speech, context, self.panel_deadline): (idx, judge)
+            for idx, judge in enumerate(self.panel) if judge != "heuristic"
+        }
+        results = {}
+        failed = []
+        over_budget = []
+        for idx, judge in enumerate(self.panel):
+            if judge == "heuristic":
+                results[(idx, judge)] = self._judge(judge, scoring_speech, context)
+
+        pending = set(futures)
+        while pending and len(results) < self.panel_quorum:
+            done, pending = wait(pending, timeout=max(0, deadline - time.monotonic()),
+                                 return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                idx, judge = futures[future]
+                try:
+                    results[(idx, judge)] = future.result()
+                except BudgetExceeded as e:
+                    print(f"裁判 {judge} 预算不足，未评分: {str(e)}")
+                    over_budget.append(judge)
+                except Exception as e:
+                    print(f"裁判 {judge} 评分失败: {str(e)}")
+                    failed.append(judge)
+
+        # 凑齐法定人数后不再等待的裁判，与到截止时间仍未返回的裁判分开记录
+        unfinished = [futures[future][1] for future in sorted(pending, key=lambda f: futures[f][0])]
+        quorum_reached = len(results) >= self.panel_quorum
+        for future in pending:
+            future.cancel()
+
+        if not results:
+            print("评审团无人按时完成评分，改用启发式评分")
+            results[(len(self.panel), "heuristic")] = self._judge("heuristic", scoring_speech, context)
+        # 按评审团顺序排列，明细与完成先后无关
+        results = {f"{judge}#{idx}": results[(idx, judge)] for idx, judge in sorted(results)}
+
+        dims = list(next(iter(results.values())).keys())
+        scores = {}
+        variance = {}
+        for dim in dims:
+            values = [judge_scores[dim] for judge_scores in results.values() if dim in judge_scores]
+            scores[dim] = round(self._aggregate(values), 2)
+            variance[dim] = round(statistics.pvariance(values), 4) if len(values) > 1 else 0.0
+
+        return scores, {
+            "judges": results,
+            "aggregate": self.panel_aggregate,
+            "variance": variance,
+            "timed_out": [] if quorum_reached else unfinished,
+            "after_quorum": unfinished if quorum_reached else [],
+            "failed": failed,
+            "over_budget": over_budget
+        }
+
+    def _aggregate(self, values: list) -> float:
+        """
+        中位数，或去掉两端各20%（至少各1个，裁判不少于3人时）后的截尾均值
+        """
+        if self.panel_aggregate == "trimmed_mean" and len(values) >= 3:
+            ordered = sorted(values)
+            trim = max(1, int(len(ordered) * 0.2))
+            return statistics.mean(ordered[trim:len(ordered) - trim])
+        if self.panel_aggregate == "mean":
+            return statistics.mean(values)
+        return statistics.median(values)
     
     def _generate_comment(self, scores: dict) -> str:
         comments = []
@@ -0,0 +1,215 @@
+# ----------------------------------------------------------
+# load_test.py
+# 并发压测：用进程内桩LLM驱动大量DebateSimulator，逐级提升并发，
+# 输出吞吐、尾延迟、CPU与内存曲线（逐tick采样序列），报告为可直接diff的JSON
+# ----------------------------------------------------------
+
+import argparse
+import contextlib
+import json
+import os
+import resource
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from main import DebateSimulator
+from utils.stub_llm import StubLLMServer
+
+
+def _rss_mb() -> float:
+    """
+    当前常驻内存（MB），优先读 /proc，其他平台退回峰值RSS
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if peak > 2 ** 24 else peak / 1024
+
+
+def _version() -> str:
+    """
+    报告的版本标签：git describe，不在git仓库中时为unknown
+    """
+    try:
+        result = subprocess.run(["git", "describe", "--always", "--dirty", "--tags"],
+                                cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return "unknown"
+    return result.stdout.strip() or "unknown"
+
+
+def _cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    low = int(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+class ResourceSampler:
+    """
+    后台定时采样：每个tick记录 (相对起点的秒数, RSS MB, 累计CPU秒数)
+    """
+
+    def __init__(self, interval: float = 0.2):
+        self.interval = interval
+        self.samples = []
+        self._start = time.perf_counter()
+        self._cpu_start = _cpu_seconds()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self):
+        self.samples.append((time.perf_counter() - self._start, _rss_mb(), _cpu_seconds() - self._cpu_start))
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._sample()
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        self._cpu_start = _cpu_seconds()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+    @property
+    def rss(self) -> list:
+        return [rss for _, rss, _ in self.samples]
+
+    def series(self) -> dict:
+        """
+        报告用的时间序列（列式，便于在两份报告之间逐点diff）
+        """
+        return {
+            "t_s": [round(t, 3) for t, _, _ in self.samples],
+            "rss_mb": [round(rss, 1) for _, rss, _ in self.samples],
+            "cpu_s": [round(cpu, 3) for _, _, cpu in self.samples]
+        }
+
+
+def run_level(concurrency: int, debates: int, config: dict, roles: list, ai_referee: bool, stub: StubLLMServer) -> dict:
+    """
+    以给定并发度跑完 debates 场辩论，返回该级别的指标
+    """
+    latencies = []
+    failures = []
+    stats_before = dict(stub.stats)
+
+    def one(index: int):
+        start = time.perf_counter()
+        try:
+            simulator = DebateSimulator("人工智能是否威胁人类就业", roles, dict(config, seed=index), ai_referee)
+            simulator.run_debate()
+            latencies.append(time.perf_counter() - start)
+        except Exception as e:
+            failures.append(type(e).__name__)
+
+    cpu_start = _cpu_seconds()
+    wall_start = time.perf_counter()
+    # 辩论实录直接丢弃，不在内存里累积，以免抬高RSS曲线
+    with ResourceSampler() as sampler, open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(one, range(debates)))
+    wall = time.perf_counter() - wall_start
+    cpu = _cpu_seconds() - cpu_start
+
+    requests = {key: stub.stats[key] - stats_before.get(key, 0) for key in stub.stats}
+    return {
+        "concurrency": concurrency,
+        "debates": debates,
+        "failed": len(failures),
+        "failure_types": sorted(set(failures)),
+        "wall_s": round(wall, 3),
+        "throughput_debates_per_s": round(len(latencies) / wall, 3) if wall else 0.0,
+        "latency_s": {f"p{q}": round(_percentile(latencies, q), 3) for q in (50, 95, 99)},
+        "latency_max_s": round(max(latencies), 3) if latencies else 0.0,
+        "cpu_s": round(cpu, 3),
+        "cpu_utilization_cores": round(cpu / wall, 3) if wall else 0.0,
+        "rss_mb": {
+            "start": round(sampler.rss[0], 1),
+            "peak": round(max(sampler.rss), 1),
+            "end": round(sampler.rss[-1], 1)
+        },
+        "series": sampler.series(),
+        "stub_requests": requests,
+        "llm_requests_per_s": round(requests["requests"] / wall, 2) if wall else 0.0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Debate simulator load test')
+    parser.add_argument('--levels', type=int, nargs='+', default=[1, 5, 10, 50],
+                        help='逐级提升的并发辩论数')
+    parser.add_argument('--debates_per_level', type=int, default=0,
+                        help='每级跑的场次，默认等于该级并发数')
+    parser.add_argument('--latency', type=str, default="lognormal:0.05:0.5",
+                        help='桩LLM延迟分布：fixed:s / uniform:lo:hi / lognormal:median:sigma / exponential:mean')
+    parser.add_argument('--error_rate', type=float, default=0.0, help='桩LLM返回500的概率')
+    parser.add_argument('--rps', type=float, default=0.0, help='桩LLM限流（每秒请求数），0为不限流')
+    parser.add_argument('--ai_referee', action='store_true', help='使用LLM裁判')
+    parser.add_argument('--format', type=str, default="default", help='赛制')
+    parser.add_argument('--max_concurrency', type=int, default=4, help='单场辩论内的并发turn数')
+    parser.add_argument('--output', type=str, default="load_report.json", help='报告路径')
+    args = parser.parse_args()
+
+    roles = ["正方一辩", "反方一辩", "正方二辩", "反方二辩"]
+    config = {
+        "debate_format": args.format,
+        "max_concurrency": args.max_concurrency,
+        "turn_delay": 0,
+        "max_speech_length": 800
+    }
+
+    with StubLLMServer(latency=args.latency, error_rate=args.error_rate, rps=args.rps) as stub:
+        os.environ["DASHSCOPE_BASE_URL"] = stub.base_url
+        os.environ.setdefault("DASHSCOPE_API_KEY", "stub")
+
+        levels = []
+        for concurrency in args.levels:
+            result = run_level(concurrency, args.debates_per_level or concurrency, config, roles,
+                               args.ai_referee, stub)
+            levels.append(result)
+            print(f"并发 {concurrency:>4}: {result['throughput_debates_per_s']:.2f} 场/秒, "
+                  f"p95 {result['latency_s']['p95']:.2f}s, CPU {result['cpu_utilization_cores']:.2f}核, "
+                  f"RSS峰值 {result['rss_mb']['peak']:.0f}MB, 失败 {result['failed']}")
+
+    report = {
+        "version": _version(),
+        "settings": {
+            "levels": args.levels,
+            "debates_per_level": args.debates_per_level,
+            "latency": args.latency,
+            "error_rate": args.error_rate,
+            "rps": args.rps,
+            "ai_referee": args.ai_referee,
+            "format": args.format,
+            "max_concurrency": args.max_concurrency
+        },
+        "levels": levels
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2, sort_keys=True)
+    print(f"报告已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,21 +6,25 @@
 # ----------------------------------------------------------
 
 import os
-import random
 import time
+import uuid
+import threading
 import argparse
 from typing import List, Dict
-from agents.debater_agent import DebaterAgent
+from agents.debater_agent import DebaterAgent, FAILED_OUTPUTS
 from agents.referee_agent import RefereeAgent
 from agents.player_agent import PlayerAgent
 from utils.config_loader import ConfigLoader
+from utils.scoring_system import ScoringSystem
+from utils.rating_system import RatingSystem
+from utils.score_archive import ScoreArchive
+from utils.token_budget import TokenBudget
+from utils.debate_format import DebateFormat
+from utils.turn_scheduler import TurnScheduler
+from utils.repetition_detector import RepetitionDetector
 
-DEBATE_STAGES = [
-    {"name": "立论阶段", "order": "sequential", "rounds": 1},
-    {"name": "质询阶段", "order": "cross", "rounds": 2},
-    {"name": "自由辩论阶段", "order": "random", "rounds": 3},
-    {"name": "结辩阶段", "order": "sequential", "rounds": 1}
-]
+# 开启预生成草稿时，在这些阶段让下一位辩手提前起草
+SPECULATIVE_STAGES = ["质询阶段", "自由辩论阶段"]
 
 
 class DebateSimulator:
@@ -30,10 +34,31 @@ class DebateSimulator:
         self.config = config
         self.ai_used = ai_used
         self.player_roles = player_roles or []
+        # 单场token预算，batch_budget为多场共享的上级预算
+        self.budget = TokenBudget(config.get("token_budget"), parent=config.get("batch_budget"))
         self.agents = self._create_agents()
         self.speech_history = []
+        # 重复发言检测：repetition_index 为批量任务共享的索引，否则每场单独建索引
+        self.debate_id = config.get("debate_id") or uuid.uuid4().hex[:8]
+        if config.get("repetition_index") is not None:
+            self.repetition = config["repetition_index"]
+        elif config.get("repetition_detection"):
+            self.repetition = RepetitionDetector(threshold=config.get("repetition_threshold", 0.6))
+        else:
+            self.repetition = None
         self.current_stage = 0
 
+        # 赛制从配置加载，并按固定种子预先编译成发言计划
+        self.stages = DebateFormat.load(config.get("debate_format"))
+        debaters = [a for a in self.agents if a["type"] in ["debater", "player"]]
+        referee = next(a for a in self.agents if a["type"] == "referee")
+        self.plan = DebateFormat.compile(self.stages, debaters, referee, seed=config.get("seed"))
+        # 预算按剩余的计划LLM调用数均分给每次调用，避免前面的发言用光预算；
+        # 会被提前起草的发言另计一次草稿调用（起草时扣除）
+        drafts = sum(1 for turn in self.plan if self._draft_target(turn) is not None)
+        self._llm_calls_left = sum(self._llm_calls(turn) for turn in self.plan) + drafts
+        self._pace_lock = threading.Lock()
+
     def _create_agents(self) -> List[Dict]:
         """
         初始化智能体
@@ -44,8 +69,15 @@ class DebateSimulator:
             agent_id = f"debater_{len(agents)}"
             config = {
                 "knowledge_agent": self.config.get("knowledge_agent_config", {}),
-                "max_speech_length": self.config.get("max_speech_length", 800)
+                "max_speech_length": self.config.get("max_speech_length", 800),
+                "speculative_drafts": self.config.get("speculative_drafts", False),
+                "max_draft_lag": self.config.get("max_draft_lag", 1),
+                "token_budget": self.budget
             }
+            # 可为正反双方指定不同模型，用于跨模型评级
+            team_model = self.config.get("team_models", {}).get(role[:2])
+            if team_model:
+                config["model"] = team_model
             # 区分是否玩家参加
             if role in self.player_roles:
                 agent = PlayerAgent(agent_id, role, config)
@@ -64,7 +96,14 @@ class DebateSimulator:
 
         # 创建裁判
         referee_config = {
-            "knowledge_agent": self.config.get("knowledge_agent_config", {})
+            "knowledge_agent": self.config.get("knowledge_agent_config", {}),
+            "relevance_engine": self.config.get("relevance_engine", "jaccard"),
+            "token_budget": self.budget,
+            "judge_panel": self.config.get("judge_panel"),
+            "panel_aggregate": self.config.get("panel_aggregate", "median"),
+            "panel_deadline": self.config.get("panel_deadline", 30),
+            "panel_quorum": self.config.get("panel_quorum"),
+            "repetition_strength": self.config.get("repetition_strength", 0.5)
         }
         referee_agent = RefereeAgent("referee_0", "裁判", referee_config, self.ai_used)
         agents.append({
@@ -75,99 +114,191 @@ class DebateSimulator:
         })
         return agents
 
-    def run_debate(self):
+    def run_debate(self) -> Dict:
         """
         辩论赛主程序
+        赛制预先编译成发言计划，由调度器按依赖关系执行，
+        互不依赖的发言与评分并发进行，输出仍按计划顺序展示
         """
         print(f"\n{'=' * 50}")
         print(f"辩论开始！主题: {self.topic}")
         print(f"Player-controlled roles: {', '.join(self.player_roles)}")
         print(f"{'=' * 50}\n")
 
-        for stage_index, stage in enumerate(DEBATE_STAGES):
-            self.current_stage = stage_index
-            stage_name = stage["name"]
-            stage_rounds = stage["rounds"]
+        # 有玩家参与时串行执行，避免多个输入提示交错
+        max_workers = 1 if self.player_roles else self.config.get("max_concurrency", 4)
+        TurnScheduler(max_workers).run(
+            self.plan,
+            execute=self._execute_turn,
+            on_commit=self._commit_turn,
+            on_start=self._start_turn
+        )
+
+        return self.announce_result()
+
+    def _turn_context(self, turn: Dict, history: List[Dict]) -> Dict:
+        return {
+            "topic": self.topic,
+            "current_stage": turn["stage"]["name"],
+            "stage_round": turn["round"],
+            "speech_history": history
+        }
 
+    def _llm_calls(self, turn: Dict) -> int:
+        """
+        一个turn计划发出的LLM调用数（玩家发言与启发式裁判不调用LLM）
+        """
+        if turn["kind"] == "speech":
+            return 1 if turn["agent"]["type"] == "debater" else 0
+        panel = self.config.get("judge_panel")
+        if panel:
+            return sum(1 for judge in panel if judge != "heuristic")
+        return 1 if self.ai_used else 0
+
+    def _execute_turn(self, turn: Dict, history: List[Dict]) -> Dict:
+        """
+        在调度器线程中执行单个turn：辩手发言或裁判评分
+        """
+        context = self._turn_context(turn, history)
+        with self._pace_lock:
+            allowance = self.budget.allowance(self._llm_calls_left)
+            self._llm_calls_left -= self._llm_calls(turn)
+        context["token_allowance"] = allowance
+        if turn["kind"] != "judgment":
+            return turn["agent"]["agent"].generate_response(context)
+
+        speech = history[-1]
+        context["current_speech"] = speech
+        if speech.get("full_content", speech.get("content")) in FAILED_OUTPUTS:
+            # 发言生成失败（如预算耗尽）时不评分，也不计入队伍平均分
+            return {
+                "agent_id": turn["agent"]["id"],
+                "type": "judgment",
+                "scores": {},
+                "comment": "发言生成失败，本轮不评分",
+                "skipped": True
+            }
+        if self.repetition is None:
+            return turn["agent"]["agent"].generate_response(context)
+
+        # 评分按计划顺序串行执行，发言在此按顺序加入索引
+        key = f"{self.debate_id}:{turn['speech']}"
+        matches = self.repetition.observe(key, speech.get("full_content", speech.get("content", "")))
+        # 只有本场之前的发言算重复并扣分；共享索引中其他场次的匹配只用于复用评分
+        own = [(match, similarity) for match, similarity in matches if match.startswith(f"{self.debate_id}:")]
+        if own:
+            context["repetition"] = {
+                "similarity": own[0][1],
+                "matches": [match for match, _ in own[:3]]
+            }
+        context["cached_scores"] = self.repetition.cached_judgment(matches)
+        judgment = turn["agent"]["agent"].generate_response(context)
+        self.repetition.remember_judgment(
+            key, judgment.get("repetition", {}).get("unpenalized_scores", judgment["scores"])
+        )
+        return judgment
+
+    def _draft_target(self, turn: Dict):
+        """
+        本次发言开始时应提前起草的下一次发言（依赖本次发言的下一位AI辩手），没有则返回None
+        """
+        if not self.config.get("speculative_drafts") or turn["kind"] != "speech":
+            return None
+        stage_name = turn["stage"]["name"]
+        if stage_name not in self.config.get("speculative_stages", SPECULATIVE_STAGES):
+            return None
+
+        next_turn = next(
+            (t for t in self.plan[turn["id"] + 1:] if t["kind"] == "speech"), None
+        )
+        if (next_turn is not None and next_turn["stage"] is turn["stage"]
+                and turn["id"] in next_turn["deps"]
+                and next_turn["agent"]["type"] == "debater"
+                and next_turn["agent"] is not turn["agent"]):
+            return next_turn
+        return None
+
+    def _start_turn(self, turn: Dict, history: List[Dict]):
+        """
+        当前辩手开始发言时，依赖本次发言的下一位AI辩手在后台起草
+        """
+        next_turn = self._draft_target(turn)
+        if next_turn is None:
+            return
+        draft_context = self._turn_context(next_turn, history)
+        with self._pace_lock:
+            draft_context["token_allowance"] = self.budget.allowance(self._llm_calls_left)
+            self._llm_calls_left -= 1
+        next_turn["agent"]["agent"].start_draft(draft_context)
+
+    def _commit_turn(self, turn: Dict, response: Dict):
+        """
+        按计划顺序写入历史并展示
+        """
+        stage = turn["stage"]
+        stage_index = self.stages.index(stage)
+        first_of_stage = turn["id"] == 0 or self.plan[turn["id"] - 1]["stage"] is not stage
+        if first_of_stage:
+            self.current_stage = stage_index
             print(f"\n{'=' * 50}")
-            print(f"当前阶段: {stage_name} (轮次: {stage_rounds})")
+            print(f"当前阶段: {stage['name']} (轮次: {stage['rounds']})")
             print(f"{'=' * 50}")
-
-            for round_num in range(1, stage_rounds + 1):
-                print(f"\n--- Round {round_num} ---")
-
-                # 根据不同阶段调整不同的顺序
-                debaters = [a for a in self.agents if a["type"] in ["debater", "player"]]
-
-                if stage["order"] == "sequential":
-                    # 顺序发言
-                    speaker_order = debaters
-                elif stage["order"] == "cross":
-                    # 交叉发言
-                    pro_debaters = [d for d in debaters if d["team"] == "正方"]
-                    con_debaters = [d for d in debaters if d["team"] == "反方"]
-                    speaker_order = []
-                    for i in range(max(len(pro_debaters), len(con_debaters))):
-                        if i < len(pro_debaters):
-                            speaker_order.append(pro_debaters[i])
-                        if i < len(con_debaters):
-                            speaker_order.append(con_debaters[i])
-                else:
-                    # 随机排序发言
-                    random.shuffle(debaters)
-                    speaker_order = debaters
-
-                # 合成发言
-                for agent_info in speaker_order:
-                    context = {
-                        "topic": self.topic,
-                        "current_stage": stage_name,
-                        "stage_round": round_num,
-                        "speech_history": self.speech_history
-                    }
-
-                    response = agent_info["agent"].generate_response(context)
-                    self.speech_history.append(response)
-
-                    if agent_info["type"] == "player":
-                        print(f"\n【{agent_info['role']}】(玩家)发言：")
-                    else:
-                        print(f"\n【{agent_info['role']}】(AI)截断后发言：")
-                    print(f"{response['content']}")
-
-                    # 收集信息交由裁判系统判断
-                    referee = next(a for a in self.agents if a["type"] == "referee")
-                    judge_context = {
-                        "topic": self.topic,
-                        "current_stage": stage_name,
-                        "stage_round": round_num,
-                        "speech_history": self.speech_history,
-                        "current_speech": response
-                    }
-                    judgment = referee["agent"].generate_response(judge_context)
-                    self.speech_history.append(judgment)
-
-                    # 展示分数
-                    print(f"\n【裁判】评分:")
-                    for dim, score in judgment["scores"].items():
-                        print(f"  {dim}: {score:.2f}")
-                    print(f"Comment: {judgment['comment']}")
-
-                    time.sleep(1)
-
-        self.announce_result()
-
-    def announce_result(self):
+        if first_of_stage or self.plan[turn["id"] - 1]["round"] != turn["round"]:
+            print(f"\n--- Round {turn['round']} ---")
+
+        response.setdefault("stage", stage["name"])
+        self.speech_history.append(response)
+        agent_info = turn["agent"]
+
+        if turn["kind"] == "speech":
+            if response.get("full_content", response.get("content")) in FAILED_OUTPUTS:
+                print(f"\n【{agent_info['role']}】发言生成失败，跳过本轮")
+                return
+            if agent_info["type"] == "player":
+                print(f"\n【{agent_info['role']}】(玩家)发言：")
+            else:
+                print(f"\n【{agent_info['role']}】(AI)截断后发言：")
+            print(f"{response['content']}")
+            return
+
+        if response.get("skipped"):
+            return
+
+        # 展示分数
+        print(f"\n【裁判】评分:")
+        panel = response.get("panel")
+        for dim, score in response["scores"].items():
+            if panel:
+                print(f"  {dim}: {score:.2f} (方差 {panel['variance'].get(dim, 0):.3f})")
+            else:
+                print(f"  {dim}: {score:.2f}")
+        if panel:
+            print(f"评审团: {len(panel['judges'])}人有效 ({panel['aggregate']})"
+                  + (f"，超时丢弃: {', '.join(panel['timed_out'])}" if panel["timed_out"] else "")
+                  + (f"，达到法定人数后未等待: {', '.join(panel['after_quorum'])}" if panel["after_quorum"] else "")
+                  + (f"，预算不足未评分: {', '.join(panel['over_budget'])}" if panel["over_budget"] else ""))
+        repetition = response.get("repetition")
+        if repetition:
+            print(f"重复发言: 与 {', '.join(repetition['matches'])} 相似度 {repetition['similarity']:.2f}")
+        if response.get("reused"):
+            print("与已评分的发言几乎相同，复用已有评分")
+        print(f"Comment: {response['comment']}")
+
+        time.sleep(self.config.get("turn_delay", 1))
+
+    def announce_result(self) -> Dict:
         """
         Calculate and display final debate scores
+        :return: 结果字典，包含胜方、各队各维度平均分、分差以及评级对象
         """
         team_scores = {"正方": 0, "反方": 0}
         team_counts = {"正方": 0, "反方": 0}
+        dimension_scores = {"正方": {}, "反方": {}}
 
         # 开始评分
-        for speech in self.speech_history:
-            if speech["type"] == "judgment":
-                prev_idx = self.speech_history.index(speech) - 1
+        for idx, speech in enumerate(self.speech_history):
+            if speech["type"] == "judgment" and not speech.get("skipped"):
+                prev_idx = idx - 1
                 if prev_idx >= 0 and self.speech_history[prev_idx]["type"] == "argument":
                     debater_speech = self.speech_history[prev_idx]
                     team = debater_speech["role"][:2]
@@ -175,14 +306,21 @@ class DebateSimulator:
                         total_score = sum(speech["scores"].values())
                         team_scores[team] += total_score
                         team_counts[team] += 1
+                        for dim, score in speech["scores"].items():
+                            dimension_scores[team][dim] = dimension_scores[team].get(dim, 0) + score
 
         # 计算平均分数
         team_avg = {}
+        dimension_avg = {}
         for team, total in team_scores.items():
             if team_counts[team] > 0:
                 team_avg[team] = total / team_counts[team]
+                dimension_avg[team] = {
+                    dim: score / team_counts[team] for dim, score in dimension_scores[team].items()
+                }
             else:
                 team_avg[team] = 0
+                dimension_avg[team] = {}
 
         # 展示结果
         print("\n" + "=" * 50)
@@ -193,13 +331,51 @@ class DebateSimulator:
 
         # 判断胜者
         if team_avg["正方"] > team_avg["反方"]:
+            winner = "正方"
             print("\n胜方: 正方！")
         elif team_avg["反方"] > team_avg["正方"]:
+            winner = "反方"
             print("\n胜方: 反方！")
         else:
+            winner = None
             print("\n平局！")
         print("=" * 50)
 
+        margins = {"total": team_avg["正方"] - team_avg["反方"]}
+        for dim in set(dimension_avg["正方"]) | set(dimension_avg["反方"]):
+            margins[dim] = dimension_avg["正方"].get(dim, 0) - dimension_avg["反方"].get(dim, 0)
+
+        return {
+            "topic": self.topic,
+            "winner": winner,
+            "team_avg": team_avg,
+            "dimension_avg": dimension_avg,
+            "margins": margins,
+            "entities": {team: self._team_entity(team) for team in ("正方", "反方")},
+            "models": {
+                a["role"]: ("player" if a["type"] == "player" else a["agent"].config.get("model", "qwen-turbo"))
+                for a in self.agents if a["type"] in ["debater", "player"]
+            },
+            "token_usage": {
+                "total": self.budget.ledger.total(),
+                "by_stage": self.budget.ledger.summary("stage"),
+                "by_model": self.budget.ledger.summary("model")
+            }
+        }
+
+    def _team_entity(self, team: str) -> str:
+        """
+        评级对象：队伍实际使用的模型 + 提示词版本，有玩家参与的队伍记为player
+        """
+        members = [a for a in self.agents if a.get("team") == team]
+        if any(a["type"] == "player" for a in members):
+            model = "player"
+        elif members:
+            model = members[0]["agent"].config.get("model", "qwen-turbo")
+        else:
+            model = "none"
+        return RatingSystem.entity(model, self.config.get("prompt_variant", "default"))
+
 
 def main():
     '''
@@ -224,6 +400,38 @@ def main():
                         type=bool,
                         default=False,
                         help='是否使用AI裁判'),
+    parser.add_argument('--pro_model', type=str, default=None,
+                        choices=["qwen-turbo", "qwen-plus", "qwen-max"],
+                        help='正方辩手使用的模型')
+    parser.add_argument('--con_model', type=str, default=None,
+                        choices=["qwen-turbo", "qwen-plus", "qwen-max"],
+                        help='反方辩手使用的模型')
+    parser.add_argument('--prompt_variant', type=str, default=None,
+                        help='提示词版本标签，用于评级')
+    parser.add_argument('--ratings_file', type=str, default=None,
+                        help='跨场次评级文件，给出时用本场结果增量更新评级')
+    parser.add_argument('--format', type=str, default=None,
+                        help='赛制：default / 新国辩 / oxford，或赛制JSON文件路径')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='随机种子，固定后发言顺序可复现')
+    parser.add_argument('--token_budget', type=int, default=None,
+                        help='单场辩论的token上限，超出前会缩短历史、降低输出长度或改用启发式裁判')
+    parser.add_argument('--speculative_drafts', action='store_true',
+                        help='质询与自由辩论阶段让下一位AI辩手提前起草发言')
+    parser.add_argument('--judge_panel', nargs='+', default=None,
+                        help='评审团成员，heuristic 或模型名，例如 heuristic qwen-max qwen-plus')
+    parser.add_argument('--panel_aggregate', type=str, default=None,
+                        choices=["median", "trimmed_mean", "mean"],
+                        help='评审团分数汇总方式')
+    parser.add_argument('--panel_deadline', type=float, default=None,
+                        help='评审团截止时间（秒），超时的裁判被丢弃')
+    parser.add_argument('--score_archive', type=str, default=None,
+                        help='列式评分存档目录，给出时追加本场全部评分')
+    parser.add_argument('--relevance_engine', type=str, default=None,
+                        choices=["jaccard", "embedding"],
+                        help='启发式裁判的相关性计算方式')
+    parser.add_argument('--repetition_detection', action='store_true',
+                        help='用MinHash/LSH检测与全部历史发言的重复，并扣减重复发言的得分')
     args = parser.parse_args()
 
     config = ConfigLoader.load_config()
@@ -232,6 +440,29 @@ def main():
         "model": args.model
     }
     config["knowledge_agent_config"] = knowledge_config
+    if args.judge_panel:
+        config["judge_panel"] = args.judge_panel
+    if args.panel_aggregate:
+        config["panel_aggregate"] = args.panel_aggregate
+    if args.panel_deadline:
+        config["panel_deadline"] = args.panel_deadline
+    if args.format:
+        config["debate_format"] = args.format
+    if args.seed is not None:
+        config["seed"] = args.seed
+    if args.token_budget:
+        config["token_budget"] = args.token_budget
+    if args.speculative_drafts:
+        config["speculative_drafts"] = True
+    if args.relevance_engine:
+        config["relevance_engine"] = args.relevance_engine
+    if args.repetition_detection:
+        config["repetition_detection"] = True
+    team_models = {team: model for team, model in (("正方", args.pro_model), ("反方", args.con_model)) if model}
+    if team_models:
+        config["team_models"] = team_models
+    if args.prompt_variant:
+        config["prompt_variant"] = args.prompt_variant
 
     # 初始化
     player_roles = args.player_roles or []
@@ -239,7 +470,27 @@ def main():
     print(f"辩手角色: {', '.join(args.roles)}")
     print(f"玩家控制的角色: {', '.join(player_roles) if player_roles else '无'}")
     simulator = DebateSimulator(args.topic, args.roles, config, args.ai_use, player_roles=player_roles)
-    simulator.run_debate()
+    result = simulator.run_debate()
+    print(f"本场token用量: {result['token_usage']['total']}")
+    if args.score_archive:
+        rows = ScoreArchive(args.score_archive).append_debate(simulator.speech_history, result["models"])
+        print(f"已追加 {rows} 条评分到存档 {args.score_archive}")
+    if args.ai_use or args.judge_panel:
+        metrics = ScoringSystem.parse_metrics()
+        print(f"评分解析: 共{metrics['total']}次，修复{metrics['repaired']}次，"
+              f"失败率{metrics['failure_rate']:.1%}，提前停止读取{metrics['early_stop']}次，"
+              f"API调用失败{metrics['api_failed']}次")
+
+    if args.ratings_file:
+        ratings = RatingSystem.load(args.ratings_file)
+        if not ratings.record(result):
+            print(f"\n警告: 正反双方均为 {result['entities']['正方']}，本场不更新评级；"
+                  f"--ratings_file 需要用 --pro_model/--con_model 为双方指定不同模型")
+        ratings.save(args.ratings_file)
+        print(f"\n评级已更新（累计 {ratings.results} 场）:")
+        for row in ratings.leaderboard(top=10):
+            low, high = row["interval"]
+            print(f"  {row['entity']}: {row['rating']:.1f} [{low:.1f}, {high:.1f}] ({row['games']}场)")
 
 
 if __name__ == "__main__":
@@ -16,6 +16,20 @@ class ConfigLoader:
                 "speech_time_limit": 120,
                 "max_speech_length": 800,
                 "knowledge_validation": True,
+                # 相关性计算: "jaccard"(分词集合) 或 "embedding"(n-gram哈希向量)
+                "relevance_engine": "jaccard",
+                # 重复发言检测：相似度超过阈值时按 repetition_strength 扣分
+                "repetition_detection": False,
+                "repetition_threshold": 0.6,
+                "repetition_strength": 0.5,
+                # 预生成草稿（--speculative_drafts）：草稿之后新增的发言超过该条数即视为过期，重新生成
+                "max_draft_lag": 1,
+                # 赛制：内置赛制名或赛制JSON文件路径；seed固定发言顺序
+                "debate_format": "default",
+                "seed": None,
+                "max_concurrency": 4,
+                # 每条评分展示后的停顿（秒），压测时设为0
+                "turn_delay": 1,
                 #对不同类型的分数有不同的权重
                 "scoring_weights": {
                     "logic": 0.25,
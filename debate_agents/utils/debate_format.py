@@ -0,0 +1,162 @@
+#---------------------------------------------------------
+# debate_format.py
+# 声明式赛制：从配置加载赛制，预先编译成带依赖关系的发言计划（DAG）
+#---------------------------------------------------------
+
+import json
+import os
+import random
+from typing import Dict, List, Optional
+
+# 阶段字段：
+#   name        阶段名（评分的阶段权重按此匹配）
+#   order       sequential 顺序 / cross 正反交叉 / random 随机
+#   rounds      轮次
+#   speakers    all 全部辩手 / first 每队第一位 / last 每队最后一位
+#   independent 为True时同一轮内的发言互不依赖（只依赖之前轮次的发言），可以并发生成
+DEBATE_STAGES = [
+    {"name": "立论阶段", "order": "sequential", "rounds": 1},
+    {"name": "质询阶段", "order": "cross", "rounds": 2},
+    {"name": "自由辩论阶段", "order": "random", "rounds": 3},
+    {"name": "结辩阶段", "order": "sequential", "rounds": 1}
+]
+
+BUILTIN_FORMATS = {
+    "default": DEBATE_STAGES,
+    "新国辩": [
+        {"name": "立论阶段", "order": "cross", "rounds": 1, "speakers": "first", "independent": True},
+        {"name": "质询阶段", "order": "cross", "rounds": 1},
+        {"name": "自由辩论阶段", "order": "cross", "rounds": 2},
+        {"name": "结辩阶段", "order": "cross", "rounds": 1, "speakers": "last"}
+    ],
+    "oxford": [
+        {"name": "立论阶段", "order": "cross", "rounds": 1},
+        {"name": "自由辩论阶段", "order": "random", "rounds": 1},
+        {"name": "结辩阶段", "order": "cross", "rounds": 1, "speakers": "last"}
+    ]
+}
+
+
+class DebateFormat:
+    @staticmethod
+    def load(spec=None) -> List[Dict]:
+        """
+        加载赛制
+        :param spec: 内置赛制名 / JSON文件路径 / {"stages": [...]} / 阶段列表，None 为默认赛制
+        :return: 阶段列表
+        """
+        if spec is None:
+            spec = "default"
+        if isinstance(spec, str):
+            if spec in BUILTIN_FORMATS:
+                spec = BUILTIN_FORMATS[spec]
+            elif os.path.exists(spec):
+                with open(spec, 'r', encoding='utf-8') as f:
+                    spec = json.load(f)
+            else:
+                raise ValueError(f"未知赛制: {spec}")
+        if isinstance(spec, dict):
+            spec = spec.get("stages", [])
+
+        stages = []
+        for stage in spec:
+            if "name" not in stage:
+                raise ValueError("赛制阶段缺少 'name'")
+            if stage.get("order", "sequential") not in ("sequential", "cross", "random"):
+                raise ValueError(f"未知发言顺序: {stage['order']}")
+            stages.append({
+                "name": stage["name"],
+                "order": stage.get("order", "sequential"),
+                "rounds": int(stage.get("rounds", 1)),
+                "speakers": stage.get("speakers", "all"),
+                "independent": bool(stage.get("independent", False))
+            })
+        return stages
+
+    @staticmethod
+    def _speaker_order(stage: Dict, debaters: List[Dict], rng: random.Random) -> List[Dict]:
+        """
+        某一轮的发言顺序
+        """
+        teams = {}
+        for debater in debaters:
+            teams.setdefault(debater["team"], []).append(debater)
+        if stage["speakers"] == "first":
+            debaters = [d for d in debaters if d is teams[d["team"]][0]]
+        elif stage["speakers"] == "last":
+            debaters = [d for d in debaters if d is teams[d["team"]][-1]]
+
+        if stage["order"] == "sequential":
+            # 顺序发言
+            return list(debaters)
+        elif stage["order"] == "cross":
+            # 交叉发言
+            pro_debaters = [d for d in debaters if d["team"] == "正方"]
+            con_debaters = [d for d in debaters if d["team"] == "反方"]
+            speaker_order = []
+            for i in range(max(len(pro_debaters), len(con_debaters))):
+                if i < len(pro_debaters):
+                    speaker_order.append(pro_debaters[i])
+                if i < len(con_debaters):
+                    speaker_order.append(con_debaters[i])
+            return speaker_order
+        else:
+            # 随机排序发言
+            speaker_order = list(debaters)
+            rng.shuffle(speaker_order)
+            return speaker_order
+
+    @staticmethod
+    def compile(stages: List[Dict], debaters: List[Dict], referee: Dict, seed: Optional[int] = None) -> List[Dict]:
+        """
+        把赛制编译成发言计划（按计划顺序排列的turn列表）
+        每个turn记录：
+          deps     直接依赖的turn id，依赖全部完成后即可执行
+          history  该turn能看到的历史（依赖的传递闭包，按计划顺序），编译时就确定，保证可复现
+        依赖规则：
+          发言依赖之前的发言（independent阶段只依赖之前轮次的发言），不依赖裁判评分
+          评分依赖它所评的发言，以及上一条评分（裁判按顺序评分）
+        """
+        rng = random.Random(seed)
+        plan = []
+        speeches = []
+        last_judgment = None
+
+        for stage in stages:
+            for round_num in range(1, stage["rounds"] + 1):
+                round_start = len(speeches)
+                for agent_info in DebateFormat._speaker_order(stage, debaters, rng):
+                    visible = speeches[:round_start] if stage["independent"] else list(speeches)
+
+                    speech = {
+                        "id": len(plan),
+                        "kind": "speech",
+                        "stage": stage,
+                        "round": round_num,
+                        "agent": agent_info,
+                        "deps": tuple(visible),
+                        "history": tuple(visible)
+                    }
+                    plan.append(speech)
+
+                    judgment_deps = [speech["id"]]
+                    judged = set(visible) | {speech["id"]}
+                    if last_judgment is not None:
+                        judgment_deps.append(last_judgment["id"])
+                        judged |= set(last_judgment["history"]) | {last_judgment["id"]}
+                    judgment = {
+                        "id": len(plan),
+                        "kind": "judgment",
+                        "stage": stage,
+                        "round": round_num,
+                        "agent": referee,
+                        "speech": speech["id"],
+                        "deps": tuple(judgment_deps),
+                        "history": tuple(sorted(judged))
+                    }
+                    plan.append(judgment)
+
+                    speeches.append(speech["id"])
+                    last_judgment = judgment
+
+        return plan
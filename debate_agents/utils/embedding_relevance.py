@@ -0,0 +1,136 @@
+#---------------------------------------------------------
+# embedding_relevance.py
+# 基于字符n-gram哈希向量的相关性评分引擎（纯CPU，无需外部模型）
+#---------------------------------------------------------
+
+import hashlib
+import threading
+import zlib
+from typing import Dict, List
+
+import numpy as np
+
+
+class EmbeddingRelevance:
+    """
+    每场辩论持有一个实例：
+    - 历史发言的向量按内容哈希缓存，保存在一张按需扩容的NumPy矩阵中
+    - 每个队伍维护一份向量和，对方历史的相关性只需一次余弦运算，
+      单次评分的开销不随历史长度增长
+    - 与辩题的相关性按辩题n-gram在发言中的覆盖率计算（短辩题与长发言的余弦值普遍偏小）
+    """
+
+    def __init__(self, dim: int = 2048, ngram_sizes: tuple = (2, 3), topic_weight: float = 0.3):
+        self.dim = dim
+        self.ngram_sizes = ngram_sizes
+        self.topic_weight = topic_weight
+
+        self._matrix = np.zeros((64, dim), dtype=np.float32)
+        self._size = 0
+        self._cache: Dict[str, int] = {}
+        self._team_sums: Dict[str, np.ndarray] = {}
+        self._topic_grams: Dict[str, set] = {}
+        self._seen_ids = set()
+        self._lock = threading.Lock()
+
+    def _ngrams(self, text: str) -> set:
+        text = "".join(text.split())
+        return {text[i:i + n] for n in self.ngram_sizes for i in range(len(text) - n + 1)}
+
+    def topic_coverage(self, content: str, topic: str) -> float:
+        """
+        辩题的n-gram中在发言里出现的比例
+        """
+        grams = self._topic_grams.get(topic)
+        if grams is None:
+            grams = self._topic_grams[topic] = self._ngrams(topic)
+        if not grams:
+            return 0.0
+        return len(grams & self._ngrams(content)) / len(grams)
+
+    def embed(self, text: str) -> np.ndarray:
+        """
+        字符n-gram哈希向量（带符号哈希，L2归一化）
+        """
+        text = "".join(text.split())
+        indices = []
+        signs = []
+        for n in self.ngram_sizes:
+            for i in range(len(text) - n + 1):
+                h = zlib.crc32(text[i:i + n].encode("utf-8"))
+                indices.append(h % self.dim)
+                signs.append(1.0 if (h >> 31) & 1 else -1.0)
+
+        vector = np.zeros(self.dim, dtype=np.float32)
+        if not indices:
+            return vector
+        np.add.at(vector, np.asarray(indices), np.asarray(signs, dtype=np.float32))
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _row(self, text: str) -> int:
+        """
+        返回文本在向量矩阵中的行号，已出现过的内容直接命中缓存
+        """
+        key = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        row = self._cache.get(key)
+        if row is not None:
+            return row
+
+        if self._size == len(self._matrix):
+            grown = np.zeros((len(self._matrix) * 2, self.dim), dtype=np.float32)
+            grown[:self._size] = self._matrix[:self._size]
+            self._matrix = grown
+
+        row = self._size
+        self._matrix[row] = self.embed(text)
+        self._cache[key] = row
+        self._size += 1
+        return row
+
+    def _ingest(self, history: List[dict]):
+        """
+        增量吸收历史中尚未处理的辩手发言（从末尾向前扫描，遇到已处理项即停止）
+        """
+        pending = []
+        for item in reversed(history):
+            if id(item) in self._seen_ids:
+                break
+            pending.append(item)
+
+        for item in reversed(pending):
+            self._seen_ids.add(id(item))
+            if item.get("type") != "argument" or not item.get("content"):
+                continue
+            team = item.get("role", "")[:2]
+            row = self._row(item["content"])
+            if team not in self._team_sums:
+                self._team_sums[team] = np.zeros(self.dim, dtype=np.float32)
+            self._team_sums[team] += self._matrix[row]
+
+    def score(self, content: str, role: str, history: List[dict], topic: str) -> float:
+        """
+        相关性 = 辩题覆盖率 与 与对方全部历史发言（质心）的余弦相似度 的加权和；
+        对方尚未发言时只看辩题覆盖率
+        """
+        if not content:
+            return 0.0
+
+        with self._lock:
+            self._ingest(history)
+            vector = self._matrix[self._row(content)]
+            topic_match = self.topic_coverage(content, topic)
+
+            team = role[:2]
+            opponent_sum = np.zeros(self.dim, dtype=np.float32)
+            for other, team_sum in self._team_sums.items():
+                if other != team:
+                    opponent_sum += team_sum
+
+        if not np.any(opponent_sum):
+            return round(min(1.0, topic_match), 2)
+
+        opponent_sum /= np.linalg.norm(opponent_sum)
+        context_score = max(0.0, float(opponent_sum @ vector))
+        relevance = self.topic_weight * topic_match + (1 - self.topic_weight) * context_score
+        return round(min(1.0, relevance), 2)
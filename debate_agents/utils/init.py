@@ -4,10 +4,25 @@ from .knowledge_validator import KnowledgeValidator
 from .speech_handler import SpeechHandler
 from .scoring_system import ScoringSystem
 from .config_loader import ConfigLoader
+from .embedding_relevance import EmbeddingRelevance
+from .rating_system import RatingSystem
+from .token_budget import TokenBudget, TokenEstimator
+from .debate_format import DebateFormat
+from .turn_scheduler import TurnScheduler
+from .score_archive import ScoreArchive
+from .repetition_detector import RepetitionDetector
 
 __all__ = [
     'KnowledgeValidator',
     'SpeechHandler',
     'ScoringSystem',
-    'ConfigLoader'
+    'ConfigLoader',
+    'EmbeddingRelevance',
+    'RatingSystem',
+    'TokenBudget',
+    'TokenEstimator',
+    'DebateFormat',
+    'TurnScheduler',
+    'ScoreArchive',
+    'RepetitionDetector'
 ]
\ No newline at end of file
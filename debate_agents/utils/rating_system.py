@@ -0,0 +1,165 @@
+#---------------------------------------------------------
+# rating_system.py
+# 跨场次的模型/提示词评级（Glicko风格的Elo，带不确定度）
+#---------------------------------------------------------
+
+import heapq
+import json
+import math
+import os
+from typing import Dict, List, Optional
+
+DIMENSIONS = ["logic", "persuasion", "relevance", "clarity", "depth"]
+
+_Q = math.log(10) / 400
+
+
+class RatingSystem:
+    """
+    每条辩论结果以O(1)增量更新双方评级：
+    - "overall" 按总分胜负更新，其余五个维度按各自的平均分差更新
+    - 每个评级保存 [rating, rd, games]，rd 为评级偏差，用于给出置信区间
+    - 分差越大，更新幅度越大（胜负幅度乘子）
+    """
+
+    def __init__(self, initial_rating: float = 1500.0, initial_rd: float = 350.0, min_rd: float = 30.0):
+        self.initial_rating = initial_rating
+        self.initial_rd = initial_rd
+        self.min_rd = min_rd
+        self.results = 0
+        self.ratings: Dict[str, Dict[str, List[float]]] = {
+            dim: {} for dim in ["overall"] + DIMENSIONS
+        }
+
+    @staticmethod
+    def entity(model: str, prompt_variant: str = "default") -> str:
+        """
+        评级对象的键：模型/提示词版本
+        """
+        return f"{model}/{prompt_variant}"
+
+    def _get(self, dimension: str, entity: str) -> List[float]:
+        table = self.ratings[dimension]
+        if entity not in table:
+            table[entity] = [self.initial_rating, self.initial_rd, 0]
+        return table[entity]
+
+    @staticmethod
+    def _g(rd: float) -> float:
+        return 1 / math.sqrt(1 + 3 * (_Q * rd) ** 2 / math.pi ** 2)
+
+    @staticmethod
+    def _margin_multiplier(margin: float) -> float:
+        """
+        胜负幅度乘子：分差为0时为1，随分差对数增长
+        """
+        return 1 + math.log1p(abs(margin) * 10) / 2
+
+    def _update_pair(self, dimension: str, pro: str, con: str, margin: float):
+        """
+        单场Glicko更新，margin > 0 表示正方胜
+        """
+        a = self._get(dimension, pro)
+        b = self._get(dimension, con)
+        if margin > 0:
+            s_a = 1.0
+        elif margin < 0:
+            s_a = 0.0
+        else:
+            s_a = 0.5
+        multiplier = self._margin_multiplier(margin)
+
+        updates = []
+        for own, other, s in ((a, b, s_a), (b, a, 1 - s_a)):
+            g = self._g(other[1])
+            expected = 1 / (1 + 10 ** (-g * (own[0] - other[0]) / 400))
+            d_sq = 1 / (_Q ** 2 * g ** 2 * expected * (1 - expected))
+            precision = 1 / own[1] ** 2 + 1 / d_sq
+            rating = own[0] + _Q / precision * g * (s - expected) * multiplier
+            rd = max(self.min_rd, math.sqrt(1 / precision))
+            updates.append((own, rating, rd))
+
+        for own, rating, rd in updates:
+            own[0] = rating
+            own[1] = rd
+            own[2] += 1
+
+    def record(self, outcome: dict) -> bool:
+        """
+        吸收一场辩论结果
+        :param outcome: DebateSimulator.announce_result() 的返回值，
+                        需包含 entities{正方, 反方} 与 margins{total, 各维度}
+        :return: 是否更新了评级；双方为同一评级对象时只计场次，不更新评级
+        """
+        pro = outcome["entities"]["正方"]
+        con = outcome["entities"]["反方"]
+        margins = outcome["margins"]
+        if pro == con:
+            self.results += 1
+            return False
+
+        self._update_pair("overall", pro, con, margins.get("total", 0.0))
+        for dim in DIMENSIONS:
+            if dim in margins:
+                self._update_pair(dim, pro, con, margins[dim])
+        self.results += 1
+        return True
+
+    def leaderboard(self, dimension: str = "overall", top: Optional[int] = None, z: float = 1.96) -> List[dict]:
+        """
+        排行榜，按评级降序，附带置信区间 rating ± z * rd
+        """
+        table = self.ratings[dimension]
+        rows = table.items()
+        if top is not None:
+            rows = heapq.nlargest(top, rows, key=lambda item: item[1][0])
+        else:
+            rows = sorted(rows, key=lambda item: item[1][0], reverse=True)
+
+        return [
+            {
+                "entity": entity,
+                "rating": round(rating, 1),
+                "rd": round(rd, 1),
+                "games": int(games),
+                "interval": (round(rating - z * rd, 1), round(rating + z * rd, 1))
+            }
+            for entity, (rating, rd, games) in rows
+        ]
+
+    def save(self, file_path: str):
+        """
+        以紧凑JSON持久化（先写临时文件再替换，避免中途写坏）
+        """
+        state = {
+            "version": 1,
+            "results": self.results,
+            "initial": [self.initial_rating, self.initial_rd, self.min_rd],
+            "ratings": {
+                dim: {entity: [round(r, 3), round(rd, 3), int(n)] for entity, (r, rd, n) in table.items()}
+                for dim, table in self.ratings.items()
+            }
+        }
+        tmp_path = f"{file_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, file_path)
+
+    @classmethod
+    def load(cls, file_path: str) -> "RatingSystem":
+        """
+        读取评级状态，文件不存在时返回空的评级系统
+        """
+        if not os.path.exists(file_path):
+            return cls()
+
+        with open(file_path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+
+        system = cls(*state.get("initial", []))
+        system.results = state.get("results", 0)
+        for dim, table in state.get("ratings", {}).items():
+            system.ratings.setdefault(dim, {}).update(
+                {entity: list(values) for entity, values in table.items()}
+            )
+        return system
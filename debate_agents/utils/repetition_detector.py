@@ -0,0 +1,106 @@
+#---------------------------------------------------------
+# repetition_detector.py
+# 基于MinHash签名与LSH分桶的重复发言检测，每条发言的检测开销与历史长度无关
+#---------------------------------------------------------
+
+import threading
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# 梅森素数 2^31-1：系数与哈希值都小于 2^32，乘积不会溢出 uint64
+_PRIME = np.uint64((1 << 31) - 1)
+
+
+class RepetitionDetector:
+    """
+    - 每条发言取字符 shingle，计算 num_perm 维 MinHash 签名
+    - 签名切成 bands 段，每段作为LSH桶键；同桶的历史发言才作为候选
+    - 候选按签名一致比例估计Jaccard相似度，超过 threshold 视为重复
+    可在多场辩论间共享同一实例（批量任务），并缓存已评分发言的分数，供重复发言直接复用
+    """
+
+    def __init__(self, num_perm: int = 128, bands: int = 32, shingle_size: int = 3,
+                 threshold: float = 0.6, reuse_threshold: float = 0.9, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm 必须能被 bands 整除")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.threshold = threshold
+        self.reuse_threshold = reuse_threshold
+
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, int(_PRIME), size=num_perm).astype(np.uint64)
+        self._b = rng.randint(0, int(_PRIME), size=num_perm).astype(np.uint64)
+
+        self._signatures: Dict[str, np.ndarray] = {}
+        self._buckets: Dict[Tuple[int, bytes], List[str]] = {}
+        self._judgments: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def signature(self, text: str) -> np.ndarray:
+        """
+        MinHash签名；文本短于一个shingle时整段作为一个shingle
+        """
+        text = "".join(text.split())
+        n = self.shingle_size
+        shingles = {text[i:i + n] for i in range(max(1, len(text) - n + 1))}
+        hashes = np.fromiter(
+            (zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles)
+        ) % _PRIME
+        return ((self._a[:, None] * hashes[None, :] + self._b[:, None]) % _PRIME).min(axis=1)
+
+    def _band_keys(self, signature: np.ndarray) -> List[Tuple[int, bytes]]:
+        return [
+            (band, signature[band * self.rows:(band + 1) * self.rows].tobytes())
+            for band in range(self.bands)
+        ]
+
+    def observe(self, key: str, text: str) -> List[Tuple[str, float]]:
+        """
+        检测一条发言与之前所有发言的重复情况，并把它加入索引
+        :return: [(重复发言的key, 估计相似度)]，按相似度降序
+        """
+        signature = self.signature(text)
+        band_keys = self._band_keys(signature)
+
+        with self._lock:
+            candidates = set()
+            for band_key in band_keys:
+                candidates.update(self._buckets.get(band_key, ()))
+            candidates.discard(key)
+
+            matches = []
+            for candidate in candidates:
+                similarity = float(np.mean(self._signatures[candidate] == signature))
+                if similarity >= self.threshold:
+                    matches.append((candidate, round(similarity, 3)))
+
+            self._signatures[key] = signature
+            for band_key in band_keys:
+                self._buckets.setdefault(band_key, []).append(key)
+
+        matches.sort(key=lambda item: (-item[1], item[0]))
+        return matches
+
+    def remember_judgment(self, key: str, scores: dict):
+        """
+        记录一条发言的（未扣重复分的）评分
+        """
+        with self._lock:
+            self._judgments[key] = dict(scores)
+
+    def cached_judgment(self, matches: List[Tuple[str, float]]) -> Optional[dict]:
+        """
+        若存在相似度不低于 reuse_threshold 且已评过分的重复发言，返回其评分，调用方可跳过重新评分
+        """
+        with self._lock:
+            for candidate, similarity in matches:
+                if similarity < self.reuse_threshold:
+                    break
+                if candidate in self._judgments:
+                    return dict(self._judgments[candidate])
+        return None
@@ -0,0 +1,179 @@
+#---------------------------------------------------------
+# score_archive.py
+# 列式评分存档：每个维度一个定宽float32文件，阶段/角色/队伍/模型字典编码，
+# 查询时用内存映射读取并做向量化分组聚合
+#---------------------------------------------------------
+
+import json
+import os
+import threading
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+SCORE_KEYS = ["logic", "persuasion", "relevance", "clarity", "depth"]
+CATEGORY_COLUMNS = ["stage", "role", "team", "model"]
+
+_COLUMN_DTYPES = dict(
+    [(dim, np.float32) for dim in SCORE_KEYS]
+    + [(col, np.uint16) for col in CATEGORY_COLUMNS]
+    + [("debate", np.uint32), ("turn", np.uint16)]
+)
+
+
+class ScoreArchive:
+    """
+    目录结构：
+      <列名>.bin        定宽小端二进制列，逐场追加
+      meta.json         行数、场次数与各分类列的字典；最后写入，作为追加的提交点
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+        meta_path = os.path.join(directory, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        else:
+            meta = {"rows": 0, "debates": 0, "dictionaries": {col: [] for col in CATEGORY_COLUMNS}}
+        self.rows = meta["rows"]
+        self.debates = meta["debates"]
+        self.dictionaries = {col: list(meta["dictionaries"].get(col, [])) for col in CATEGORY_COLUMNS}
+        self._codes = {col: {value: code for code, value in enumerate(values)}
+                       for col, values in self.dictionaries.items()}
+
+    def _path(self, column: str) -> str:
+        return os.path.join(self.directory, f"{column}.bin")
+
+    def _encode(self, column: str, value: str) -> int:
+        codes = self._codes[column]
+        if value not in codes:
+            codes[value] = len(self.dictionaries[column])
+            self.dictionaries[column].append(value)
+        return codes[value]
+
+    def append_debate(self, speech_history: List[dict], models: Optional[Dict[str, str]] = None) -> int:
+        """
+        追加一场辩论的全部评分（每条紧跟在发言之后的judgment为一行，未评分的跳过）
+        :param speech_history: DebateSimulator.speech_history
+        :param models: 角色 -> 模型
+        :return: 写入的行数
+        """
+        models = models or {}
+        with self._lock:
+            columns = {column: [] for column in _COLUMN_DTYPES}
+            turn = 0
+            for prev, item in zip(speech_history, speech_history[1:]):
+                if item.get("type") != "judgment" or prev.get("type") != "argument" or item.get("skipped"):
+                    continue
+                role = prev.get("role", "")
+                for dim in SCORE_KEYS:
+                    columns[dim].append(item["scores"].get(dim, np.nan))
+                columns["stage"].append(self._encode("stage", prev.get("stage", "")))
+                columns["role"].append(self._encode("role", role))
+                columns["team"].append(self._encode("team", role[:2]))
+                columns["model"].append(self._encode("model", models.get(role, "")))
+                columns["debate"].append(self.debates)
+                columns["turn"].append(turn)
+                turn += 1
+
+            # 先按已提交的行数截掉上次中断留下的残余数据，再追加
+            for column, values in columns.items():
+                dtype = np.dtype(_COLUMN_DTYPES[column]).newbyteorder("<")
+                with open(self._path(column), 'ab') as f:
+                    f.truncate(self.rows * dtype.itemsize)
+                    f.write(np.asarray(values, dtype=dtype).tobytes())
+
+            self.rows += turn
+            self.debates += 1
+            self._write_meta()
+            return turn
+
+    def _write_meta(self):
+        meta = {"rows": self.rows, "debates": self.debates, "dictionaries": self.dictionaries}
+        meta_path = os.path.join(self.directory, "meta.json")
+        with open(f"{meta_path}.tmp", 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(f"{meta_path}.tmp", meta_path)
+
+    def column(self, name: str) -> np.ndarray:
+        """
+        以内存映射方式读取一列（只读，不加载到内存）
+        """
+        dtype = np.dtype(_COLUMN_DTYPES[name]).newbyteorder("<")
+        if self.rows == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(self._path(name), dtype=dtype, mode='r', shape=(self.rows,))
+
+    def _mask(self, where: Optional[Dict[str, object]]) -> Optional[np.ndarray]:
+        if not where:
+            return None
+        mask = np.ones(self.rows, dtype=bool)
+        for column, value in where.items():
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            codes = [self._codes[column][v] for v in values if v in self._codes[column]]
+            mask &= np.isin(self.column(column), codes)
+        return mask
+
+    def aggregate(self, by: Sequence[str] = ("stage",), dimensions: Sequence[str] = SCORE_KEYS,
+                  percentiles: Sequence[float] = (50, 90), where: Optional[Dict[str, object]] = None) -> Dict:
+        """
+        向量化分组聚合
+        :param by: 分组列（stage / role / team / model 的任意组合，可为空表示整体）
+        :param dimensions: 聚合的评分维度
+        :param percentiles: 百分位（0-100，线性插值）
+        :param where: 过滤条件 {列名: 值或值列表}
+        :return: {分组取值元组: {维度: {count, mean, std, p50, ...}}}
+        """
+        mask = self._mask(where)
+        keys = np.zeros(self.rows, dtype=np.int64)
+        for column in by:
+            keys = keys * (len(self.dictionaries[column]) + 1) + self.column(column)
+        if mask is not None:
+            keys = keys[mask]
+
+        groups, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+        if len(groups) == 0:
+            return {}
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+        # 分组键解码回原始取值
+        labels = []
+        remainder = groups.copy()
+        decoded = {}
+        for column in reversed(by):
+            base = len(self.dictionaries[column]) + 1
+            decoded[column] = remainder % base
+            remainder //= base
+        for idx in range(len(groups)):
+            labels.append(tuple(self.dictionaries[column][decoded[column][idx]] for column in by))
+
+        result = {label: {} for label in labels}
+        for dim in dimensions:
+            values = np.asarray(self.column(dim), dtype=np.float64)
+            if mask is not None:
+                values = values[mask]
+            sums = np.bincount(inverse, weights=values, minlength=len(groups))
+            squares = np.bincount(inverse, weights=values * values, minlength=len(groups))
+            means = sums / counts
+            stds = np.sqrt(np.maximum(squares / counts - means * means, 0))
+
+            # 按(组, 分数)排序后，各组的百分位即组内有序区间上的插值
+            ordered = values[np.lexsort((values, inverse))]
+            pct = {}
+            for q in percentiles:
+                position = starts + (counts - 1) * (q / 100)
+                low = np.floor(position).astype(np.int64)
+                high = np.minimum(low + 1, starts + counts - 1)
+                frac = position - low
+                pct[q] = ordered[low] * (1 - frac) + ordered[high] * frac
+
+            for idx, label in enumerate(labels):
+                stats = {"count": int(counts[idx]), "mean": float(means[idx]), "std": float(stds[idx])}
+                for q in percentiles:
+                    stats[f"p{q:g}"] = float(pct[q][idx])
+                result[label][dim] = stats
+        return result
@@ -2,46 +2,207 @@
 import time
 import jieba 
 from typing import List, Dict
-from openai import OpenAI
+from openai import APITimeoutError, OpenAI
 import os
 import re
 import json
+import threading
+from utils.token_budget import BudgetExceeded, TokenBudget, TokenEstimator
 
 
-def llm_api(prompt: str, max_retries=3, delay=1) -> str:
+SCORE_KEYS = ["logic", "persuasion", "relevance", "clarity", "depth"]
+
+# 支持 response_format={"type": "json_object"} 的模型；调用被拒绝时自动移出
+JSON_MODE_MODELS = {"qwen-turbo", "qwen-plus", "qwen-max"}
+
+# 重试用尽后 llm_api 的返回值
+API_FAILURE = "API调用失败，请检查网络连接和API密钥"
+
+
+class ScoreStreamParser:
+    """
+    增量解析评分：每收到一段流式输出就扫描 "维度": 数值 形式的键值对，
+    五个维度都拿到后即可停止读取（容忍代码块、前后多余文字、单引号、全角冒号等）
+    raw 保存原始数值，scores 按整段回复统一换算到0-1
+    """
+    PAIR_PATTERN = re.compile(
+        r"[\"']?(logic|persuasion|relevance|clarity|depth)[\"']?\s*[:：=]\s*[\"']?(\d+(?:\.\d+)?)(?=[^\d.])"
+    )
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.text = ""
+        self.raw = {}
+        self._scan_from = 0
+
+    def feed(self, chunk: str) -> bool:
+        """
+        :return: 五个维度是否已全部解析
+        """
+        self.text += chunk
+        for match in self.PAIR_PATTERN.finditer(self.text, self._scan_from):
+            key, value = match.group(1), float(match.group(2))
+            self.raw.setdefault(key, value)
+            self._scan_from = match.end()
+        return self.complete
+
+    @property
+    def complete(self) -> bool:
+        return len(self.raw) == len(SCORE_KEYS)
+
+    @property
+    def scores(self) -> Dict[str, float]:
+        return ScoreStreamParser.normalize(self.raw)
+
+    @staticmethod
+    def normalize(values: Dict[str, float]) -> Dict[str, float]:
+        """
+        模型偶尔按10分制或百分制打分：按整段回复中的最大值判断分制，统一换算回0-1
+        """
+        largest = max(values.values(), default=0.0)
+        if largest > 10:
+            scale = 100
+        elif largest > 1:
+            scale = 10
+        else:
+            scale = 1
+        return {key: max(0.0, min(1.0, value / scale)) for key, value in values.items()}
+
+
+def _read_stream(stream, parser: ScoreStreamParser) -> tuple:
+    """
+    读取流式输出，解析完五个维度后立即关闭连接
+    :return: (已读取的文本, usage或None)
+    """
+    usage = None
+    try:
+        for chunk in stream:
+            if getattr(chunk, "usage", None) is not None:
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content or ""
+            if delta and parser.feed(delta):
+                ScoringSystem.record_parse("early_stop")
+                break
+    finally:
+        close = getattr(stream, "close", None)
+        if close is not None:
+            close()
+    return parser.text, usage
+
+
+def llm_api(prompt: str, max_retries=3, delay=1, max_tokens=200, budget=None,
+            agent_id: str = "referee", stage=None, model: str = "qwen-max",
+            stream_parser: ScoreStreamParser = None, timeout: float = None, allowance: int = None) -> str:
     """
     llm大模型API的调用，温度调整为0.1确保稳定输出
+    评分结果只是一段JSON，输出上限默认200 token；给出budget时先预留再调用
+    给出stream_parser时使用JSON模式流式调用，五个维度解析完即停止读取
+    给出timeout时作为单次请求的客户端超时（秒），超时即结束该次请求
+    allowance 为本次调用的份额（prompt + 输出），见 TokenBudget.allowance
     """
-    for attempt in range(max_retries):
-        try:
-            client = OpenAI(
-                api_key=os.getenv("DASHSCOPE_API_KEY"),
-                base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
-            )
-            response = client.chat.completions.create(
-                model="qwen-max",
-                messages=[
-                    {"role": "system", "content": "你是一位专业的辩论赛裁判"},
-                    {"role": "user", "content": f"{prompt}"},
-                ],
-                temperature=0.1
-            )
-            return response.choices[0].message.content.strip()
-        except Exception as e:
-            print(f"API调用失败 ({attempt + 1}/{max_retries}): {str(e)}")
-            if attempt < max_retries - 1:
-                time.sleep(delay)
-    return "API调用失败，请检查网络连接和API密钥"
+    messages = [
+        {"role": "system", "content": "你是一位专业的辩论赛裁判"},
+        {"role": "user", "content": f"{prompt}"},
+    ]
+    budget = budget or TokenBudget()
+    prompt_tokens = TokenEstimator.estimate_messages(messages)
+    max_tokens = budget.acquire(prompt_tokens, max_tokens, min_tokens=60, allowance=allowance)
+
+    used = (0, 0)
+    try:
+        for attempt in range(max_retries):
+            json_mode = stream_parser is not None and model in JSON_MODE_MODELS
+            try:
+                client = OpenAI(
+                    api_key=os.getenv("DASHSCOPE_API_KEY"),
+                    base_url=os.getenv("DASHSCOPE_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1"),
+                    **({"timeout": timeout, "max_retries": 0} if timeout is not None else {})
+                )
+                request = {
+                    "model": model,
+                    "messages": messages,
+                    "temperature": 0.1,
+                    "max_tokens": max_tokens
+                }
+                if json_mode:
+                    request["response_format"] = {"type": "json_object"}
+
+                if stream_parser is not None:
+                    stream = client.chat.completions.create(
+                        stream=True, stream_options={"include_usage": True}, **request
+                    )
+                    content, usage = _read_stream(stream, stream_parser)
+                    content = content.strip()
+                else:
+                    response = client.chat.completions.create(**request)
+                    content = response.choices[0].message.content.strip()
+                    usage = getattr(response, "usage", None)
+                used = TokenEstimator.from_usage(usage, prompt_tokens, content)
+                return content
+            except Exception as e:
+                print(f"API调用失败 ({attempt + 1}/{max_retries}): {str(e)}")
+                if isinstance(e, APITimeoutError):
+                    # 超时的请求服务端可能已经处理，按预留量估算记账
+                    budget.record(agent_id, stage, model, prompt_tokens, max_tokens)
+                if json_mode and "response_format" in str(e):
+                    # 后端不支持JSON模式，之后对该模型改用普通输出
+                    JSON_MODE_MODELS.discard(model)
+                if stream_parser is not None:
+                    stream_parser.reset()
+                if attempt < max_retries - 1:
+                    time.sleep(delay)
+        return API_FAILURE
+    finally:
+        budget.release(prompt_tokens + max_tokens, agent_id, stage, model, *used)
 
 
 class ScoringSystem:
+    # 评分解析统计：streamed 流式解析成功 / json 直接解析成功 / repaired 修复后解析成功 /
+    # failed 解析失败按0.5计分 / early_stop 五个维度齐全后提前停止读取 /
+    # api_failed 重试用尽仍未拿到回复（传输错误，不计入解析失败率）
+    parse_stats = {"streamed": 0, "json": 0, "repaired": 0, "failed": 0, "early_stop": 0, "api_failed": 0}
+    _stats_lock = threading.Lock()
+
+    @staticmethod
+    def record_parse(outcome: str):
+        with ScoringSystem._stats_lock:
+            ScoringSystem.parse_stats[outcome] += 1
+
+    @staticmethod
+    def parse_metrics() -> Dict[str, float]:
+        """
+        评分解析指标；repaired 即修复解析后省下的重新调用次数
+        """
+        with ScoringSystem._stats_lock:
+            stats = dict(ScoringSystem.parse_stats)
+        total = stats["streamed"] + stats["json"] + stats["repaired"] + stats["failed"]
+        stats["total"] = total
+        stats["failure_rate"] = stats["failed"] / total if total else 0.0
+        return stats
+
     @staticmethod
-    def llm_calculate_dimension_scores(speech: dict, history: List[dict], topic: str) -> Dict[str, float]:
+    def llm_calculate_dimension_scores(speech: dict, history: List[dict], topic: str,
+                                       budget=None, agent_id: str = "referee",
+                                       usage_stage=None, model: str = "qwen-max",
+                                       timeout: float = None, max_retries: int = 3,
+                                       strict: bool = False, allowance: int = None) -> Dict[str, float]:
         """
         计算辩论发言的多维度分数（0-1范围）
         :param speech: 当前发言 {content: str, stage: str}
         :param history: 历史发言列表
         :param topic: 辩题
+        :param budget: 可选的TokenBudget，预算不足时抛出BudgetExceeded而不是按0.5评分
+        :param agent_id: 记账用的裁判id
+        :param usage_stage: 记账用的阶段名
+        :param model: 评分使用的模型
+        :param timeout: 单次请求的客户端超时（秒），None为不限
+        :param max_retries: 最多尝试次数
+        :param strict: API调用失败时抛出ConnectionError，而不是按0.5评分（评审团用）
+        :param allowance: 本次调用的token份额，超出时抛出BudgetExceeded
         :return: 各维度分数字典
         """
         content = speech.get("content", "")
@@ -50,9 +211,22 @@ class ScoringSystem:
         prompt = ScoringSystem._create_scoring_prompt(content, history, topic, stage)
 
         try:
-            response = llm_api(prompt)
-
-            scores = ScoringSystem._parse_scores(response)
+            parser = ScoreStreamParser()
+            response = llm_api(prompt, max_retries=max_retries, budget=budget, agent_id=agent_id,
+                               stage=usage_stage, model=model, stream_parser=parser, timeout=timeout,
+                               allowance=allowance)
+            if response == API_FAILURE:
+                ScoringSystem.record_parse("api_failed")
+                if strict:
+                    raise ConnectionError(f"{model} 评分请求失败")
+                scores = {key: 0.5 for key in SCORE_KEYS}
+            elif parser.complete:
+                ScoringSystem.record_parse("streamed")
+                scores = dict(parser.scores)
+            else:
+                scores = ScoringSystem._parse_scores(response)
+        except (BudgetExceeded, ConnectionError):
+            raise
         except Exception as e:
             print(f"评分失败: {str(e)}")
             scores = {
@@ -116,25 +290,62 @@ class ScoringSystem:
     def _parse_scores(response: str) -> Dict[str, float]:
         """
         解析API返回的分数
+        先按纯JSON解析；失败时去掉代码块和前后文字、修正引号与逗号后再解析；
+        仍失败则逐个提取键值对。只有全部失败才按0.5计分
         """
         try:
-            scores = json.loads(response.strip())
+            scores = ScoringSystem._validate_scores(json.loads(response.strip()))
+            ScoringSystem.record_parse("json")
+            return scores
+        except (json.JSONDecodeError, ValueError, TypeError):
+            pass
 
-            required_keys = ["logic", "persuasion", "relevance", "clarity", "depth"]
-            if not all(key in scores for key in required_keys):
-                raise ValueError("返回格式缺少必要维度")
+        repaired = ScoringSystem._repair_scores(response)
+        if repaired is not None:
+            ScoringSystem.record_parse("repaired")
+            return repaired
 
-            for key, value in scores.items():
-                if not (0.0 <= float(value) <= 1.0):
-                    raise ValueError(f"分数 {key}={value} 超出0-1范围")
+        ScoringSystem.record_parse("failed")
+        print("解析评分失败")
+        print(f"原始响应: {response}")
+        # 我们目前设置的prompt能够让AI大致按照我们规定的格式返回，但是如果实在返回了其他东西，就按0.5来评分（出现了额外的东西一般是输入内容有很怪的东西）
+        return {key: 0.5 for key in SCORE_KEYS}
 
-            return scores
+    @staticmethod
+    def _validate_scores(scores: dict) -> Dict[str, float]:
+        if not all(key in scores for key in SCORE_KEYS):
+            raise ValueError("返回格式缺少必要维度")
 
-        except (json.JSONDecodeError, ValueError) as e:
-            print(f"解析评分失败: {str(e)}")
-            print(f"原始响应: {response}")
-            # 我们目前设置的prompt能够让AI大致按照我们规定的格式返回，但是如果实在返回了其他东西，就按0.5来评分（出现了额外的东西一般是输入内容有很怪的东西）
-            return {key: 0.5 for key in required_keys}
+        result = {}
+        for key in SCORE_KEYS:
+            value = float(scores[key])
+            if not (0.0 <= value <= 1.0):
+                raise ValueError(f"分数 {key}={value} 超出0-1范围")
+            result[key] = value
+        return result
+
+    @staticmethod
+    def _repair_scores(response: str):
+        """
+        容错解析，失败返回None
+        """
+        text = re.sub(r"```(?:json)?", "", response)
+        match = re.search(r"\{.*\}", text, re.S)
+        if match:
+            candidate = match.group(0).replace("'", '"').replace("：", ":")
+            candidate = re.sub(r",\s*}", "}", candidate)
+            try:
+                raw = json.loads(candidate)
+                return ScoringSystem._validate_scores(
+                    ScoreStreamParser.normalize({key: float(raw[key]) for key in SCORE_KEYS if key in raw})
+                )
+            except (json.JSONDecodeError, ValueError, TypeError):
+                pass
+
+        parser = ScoreStreamParser()
+        if parser.feed(text + "\n"):
+            return dict(parser.scores)
+        return None
 
     @staticmethod
     def _summarize_history(history: list) -> str:
@@ -150,21 +361,28 @@ class ScoringSystem:
         )
 
     @staticmethod
-    def calculate_dimension_scores(speech: dict, history: List[dict], topic: str) -> Dict[str, float]:
+    def calculate_dimension_scores(speech: dict, history: List[dict], topic: str,
+                                   relevance_engine=None) -> Dict[str, float]:
         """
         Calculate multi-dimensional scores for debate speech
         :param speech: Current speech {content: str}
         :param history: List of historical speeches
         :param topic: Debate topic
+        :param relevance_engine: Optional EmbeddingRelevance, replaces the Jaccard relevance
         :return: Dictionary of dimension scores
         """
         content = speech.get("content", "")
+
+        if relevance_engine is not None:
+            relevance = relevance_engine.score(content, speech.get("role", ""), history, topic)
+        else:
+            relevance = ScoringSystem._calculate_relevance(content, history, topic)
         
         # 从逻辑\说服力\相关性\清晰度\深度，五个方面对于发言内容进行评分
         scores = {
             "logic": ScoringSystem._calculate_logic_score(content),
             "persuasion": ScoringSystem._calculate_persuasion_score(content),
-            "relevance": ScoringSystem._calculate_relevance(content, history, topic),
+            "relevance": relevance,
             "clarity": ScoringSystem._calculate_clarity_score(content),
             "depth": ScoringSystem._calculate_depth_score(content),
         }
@@ -180,9 +398,26 @@ class ScoringSystem:
         weight = stage_weights.get(stage, 1.0)
         for key in scores:
             scores[key] = round(scores[key] * weight, 2)
-        
+
         return scores
-    
+
+    @staticmethod
+    def apply_repetition_penalty(scores: Dict[str, float], similarity: float,
+                                 strength: float = 0.5) -> Dict[str, float]:
+        """
+        Penalize a speech that recycles an earlier one
+        :param scores: Dimension scores (not modified)
+        :param similarity: Estimated Jaccard similarity to the closest earlier speech
+        :param strength: Fraction of the score removed for an exact duplicate
+        :return: Penalized scores; only relevance, depth and persuasion are affected
+        """
+        factor = 1 - strength * max(0.0, min(similarity, 1.0))
+        penalized = dict(scores)
+        for key in ("relevance", "depth", "persuasion"):
+            if key in penalized:
+                penalized[key] = round(penalized[key] * factor, 2)
+        return penalized
+
     @staticmethod
     def _calculate_logic_score(content: str) -> float:
         """
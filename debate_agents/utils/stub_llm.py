@@ -0,0 +1,183 @@
+#---------------------------------------------------------
+# stub_llm.py
+# 进程内的OpenAI兼容桩服务，用于压测：可配置延迟分布、错误率与限流
+#---------------------------------------------------------
+
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SCORE_KEYS = ["logic", "persuasion", "relevance", "clarity", "depth"]
+
+_SPEECH_TEXT = (
+    "因为人工智能的发展，所以大量重复性岗位正在被自动化取代。然而，新的技术也会创造新的就业机会，"
+    "因此我们必须关注转型期的阵痛。综上所述，对方的论证存在明显的逻辑漏洞。"
+)
+
+
+def parse_latency(spec: str):
+    """
+    延迟分布描述 -> 采样函数（秒）
+      fixed:0.2 / uniform:0.1:0.5 / lognormal:中位数:sigma / exponential:均值
+    """
+    kind, *params = spec.split(":")
+    params = [float(p) for p in params]
+    if kind == "fixed":
+        return lambda rng: params[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(params[0], params[1])
+    if kind == "lognormal":
+        mu = math.log(params[0])
+        return lambda rng: rng.lognormvariate(mu, params[1])
+    if kind == "exponential":
+        return lambda rng: rng.expovariate(1 / params[0])
+    raise ValueError(f"未知延迟分布: {spec}")
+
+
+class StubLLMServer:
+    """
+    /v1/chat/completions 的桩实现：
+    - 裁判请求（system提示含"裁判"）返回评分JSON，其余返回一段固定发言
+    - 支持 stream=True 的SSE流式输出，携带usage
+    - error_rate 概率返回500；rps 为令牌桶限流，超出返回429
+    """
+
+    def __init__(self, latency: str = "fixed:0.05", error_rate: float = 0.0, rps: float = 0.0,
+                 speech_chars: int = 600, seed: int = 0, port: int = 0):
+        self.sample_latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.rps = rps
+        self.speech_chars = speech_chars
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._tokens = rps
+        self._last_refill = time.monotonic()
+        self.stats = {"requests": 0, "errors": 0, "throttled": 0, "streamed": 0}
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                server._handle(self, body)
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self._httpd.server_address[1]}/v1"
+
+    def start(self) -> "StubLLMServer":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _count(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _admit(self) -> bool:
+        """
+        令牌桶限流
+        """
+        if self.rps <= 0:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.rps, self._tokens + (now - self._last_refill) * self.rps)
+            self._last_refill = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    def _draw(self) -> tuple:
+        with self._lock:
+            return self.sample_latency(self._rng), self._rng.random(), [round(self._rng.random(), 2) for _ in SCORE_KEYS]
+
+    def _handle(self, handler, body: dict):
+        self._count("requests")
+        if not self._admit():
+            self._count("throttled")
+            return self._send_json(handler, 429, {"error": {"message": "rate limited", "type": "throttling"}})
+
+        latency, roll, scores = self._draw()
+        time.sleep(latency)
+        if roll < self.error_rate:
+            self._count("errors")
+            return self._send_json(handler, 500, {"error": {"message": "injected error", "type": "server_error"}})
+
+        messages = body.get("messages", [])
+        is_judge = bool(messages) and "裁判" in messages[0].get("content", "")
+        if is_judge:
+            content = json.dumps(dict(zip(SCORE_KEYS, scores)))
+        else:
+            repeats = self.speech_chars // len(_SPEECH_TEXT) + 1
+            content = (_SPEECH_TEXT * repeats)[:min(self.speech_chars, body.get("max_tokens") or self.speech_chars)]
+        usage = {
+            "prompt_tokens": sum(len(m.get("content", "")) for m in messages),
+            "completion_tokens": len(content),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        if body.get("stream"):
+            self._count("streamed")
+            return self._send_stream(handler, body.get("model", ""), content, usage)
+
+        self._send_json(handler, 200, {
+            "id": "stub", "object": "chat.completion", "created": int(time.time()), "model": body.get("model", ""),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": usage
+        })
+
+    @staticmethod
+    def _send_json(handler, status: int, payload: dict):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    @staticmethod
+    def _send_stream(handler, model: str, content: str, usage: dict):
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Transfer-Encoding", "chunked")
+        handler.end_headers()
+
+        def event(payload):
+            data = f"data: {payload}\n\n".encode("utf-8")
+            handler.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+
+        base = {"id": "stub", "object": "chat.completion.chunk", "created": int(time.time()), "model": model}
+        try:
+            for i in range(0, len(content), 8):
+                chunk = dict(base, choices=[{"index": 0, "delta": {"content": content[i:i + 8]}, "finish_reason": None}])
+                event(json.dumps(chunk, ensure_ascii=False))
+            event(json.dumps(dict(base, choices=[], usage=usage)))
+            event("[DONE]")
+            handler.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端解析完评分后提前断开
+            handler.close_connection = True
@@ -0,0 +1,172 @@
+#---------------------------------------------------------
+# token_budget.py
+# token用量记账与预算控制（离线估算，调用前即可判断是否超支）
+#---------------------------------------------------------
+
+import math
+import re
+import threading
+from typing import Dict, Optional
+
+_CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]")
+_WORD_PATTERN = re.compile(r"[A-Za-z0-9]+")
+_SPACE_PATTERN = re.compile(r"\s+")
+
+
+class BudgetExceeded(Exception):
+    """
+    预算不足以完成本次调用（调用尚未发出）
+    """
+
+
+class TokenEstimator:
+    # 每条消息的固定开销（角色标记等）
+    MESSAGE_OVERHEAD = 4
+
+    @staticmethod
+    def estimate(text: str) -> int:
+        """
+        离线估算token数，宁多勿少：
+        中文及全角字符按1个token，英文/数字按每4个字符1个token，其余符号各1个token
+        """
+        if not text:
+            return 0
+        cjk = len(_CJK_PATTERN.findall(text))
+        text = _CJK_PATTERN.sub("", text)
+        words = sum(math.ceil(len(word) / 4) for word in _WORD_PATTERN.findall(text))
+        text = _SPACE_PATTERN.sub("", _WORD_PATTERN.sub("", text))
+        return cjk + words + len(text)
+
+    @staticmethod
+    def estimate_messages(messages: list) -> int:
+        return sum(
+            TokenEstimator.estimate(message.get("content", "")) + TokenEstimator.MESSAGE_OVERHEAD
+            for message in messages
+        )
+
+
+    @staticmethod
+    def from_usage(usage, prompt_tokens: int, content: str) -> tuple:
+        """
+        优先使用接口返回的usage，缺失时用离线估算
+        """
+        if usage is not None and getattr(usage, "prompt_tokens", None) is not None:
+            return usage.prompt_tokens, usage.completion_tokens or 0
+        return prompt_tokens, TokenEstimator.estimate(content)
+
+
+class TokenLedger:
+    """
+    按 (agent_id, stage, model) 记录 prompt/completion token 用量，线程安全
+    """
+
+    def __init__(self):
+        self._records: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def record(self, agent_id: str, stage: Optional[str], model: str, prompt_tokens: int, completion_tokens: int):
+        key = (agent_id, stage or "", model)
+        with self._lock:
+            entry = self._records.setdefault(key, [0, 0, 0])
+            entry[0] += prompt_tokens
+            entry[1] += completion_tokens
+            entry[2] += 1
+
+    def total(self) -> int:
+        with self._lock:
+            return sum(prompt + completion for prompt, completion, _ in self._records.values())
+
+    def summary(self, by: str = "agent") -> Dict[str, dict]:
+        """
+        汇总用量
+        :param by: "agent" / "stage" / "model"
+        """
+        index = {"agent": 0, "stage": 1, "model": 2}[by]
+        result = {}
+        with self._lock:
+            for key, (prompt, completion, calls) in self._records.items():
+                row = result.setdefault(key[index], {"prompt_tokens": 0, "completion_tokens": 0, "calls": 0})
+                row["prompt_tokens"] += prompt
+                row["completion_tokens"] += completion
+                row["calls"] += calls
+        return result
+
+
+class TokenBudget:
+    """
+    token预算：
+    - limit 为 None 时只记账不限制
+    - parent 为上一级预算（如整批辩论共享的预算），记账与限额逐级生效
+    - 调用前先 acquire 预留 prompt + 输出上限，调用后 release 按实际用量结算
+    """
+
+    def __init__(self, limit: Optional[int] = None, parent: Optional["TokenBudget"] = None):
+        self.limit = limit
+        self.parent = parent
+        self.ledger = TokenLedger()
+        self._used = 0
+        self._reserved = 0
+        # 同一棵预算树共用一把锁，保证预留与结算在各级之间一致
+        self._lock = parent._lock if parent is not None else threading.RLock()
+
+    def _available(self) -> float:
+        own = math.inf if self.limit is None else self.limit - self._used - self._reserved
+        if self.parent is not None:
+            return min(own, self.parent._available())
+        return own
+
+    def remaining(self) -> float:
+        with self._lock:
+            return self._available()
+
+    def allowance(self, turns_left: int) -> Optional[int]:
+        """
+        本次调用的份额：剩余预算按剩余的计划调用数均分，不限额时返回None
+        """
+        remaining = self.remaining()
+        if math.isinf(remaining):
+            return None
+        return max(0, int(remaining / max(1, turns_left)))
+
+    def _adjust(self, reserved_delta: int, used_delta: int):
+        with self._lock:
+            budget = self
+            while budget is not None:
+                budget._reserved += reserved_delta
+                budget._used += used_delta
+                budget = budget.parent
+
+    def acquire(self, prompt_tokens: int, max_tokens: int, min_tokens: int = 0,
+                allowance: Optional[int] = None) -> int:
+        """
+        预留本次调用的token
+        :param allowance: 本次调用的份额（prompt + 输出），见 allowance()
+        :return: 实际允许的输出上限（可能低于max_tokens）
+        :raise BudgetExceeded: 连 min_tokens 的输出都负担不起时
+        """
+        with self._lock:
+            available = self._available()
+            if allowance is not None:
+                available = min(available, allowance)
+            granted = int(min(max_tokens, available - prompt_tokens))
+            if granted < max(min_tokens, 1):
+                raise BudgetExceeded(f"预算不足: 剩余{available}, 需要至少{prompt_tokens + min_tokens}")
+            self._adjust(prompt_tokens + granted, 0)
+        return granted
+
+    def release(self, reserved: int, agent_id: str, stage: Optional[str], model: str,
+                prompt_tokens: int, completion_tokens: int):
+        """
+        释放预留并按实际用量记账
+        """
+        self._adjust(-reserved, prompt_tokens + completion_tokens)
+        budget = self
+        while budget is not None:
+            budget.ledger.record(agent_id, stage, model, prompt_tokens, completion_tokens)
+            budget = budget.parent
+
+    def record(self, agent_id: str, stage: Optional[str], model: str, prompt_tokens: int, completion_tokens: int):
+        """
+        无预留的直接记账
+        """
+        self.release(0, agent_id, stage, model, prompt_tokens, completion_tokens)
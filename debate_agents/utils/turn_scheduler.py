@@ -0,0 +1,57 @@
+#---------------------------------------------------------
+# turn_scheduler.py
+# 按依赖关系执行发言计划：依赖满足即并发执行，结果按计划顺序提交
+#---------------------------------------------------------
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional
+
+
+class TurnScheduler:
+    """
+    - execute(turn, history) 在线程池中执行，history 为编译时确定的可见历史
+    - on_start(turn, history) 在turn提交执行时回调（主线程）
+    - on_commit(turn, result) 按计划顺序回调（主线程），保证输出与历史顺序可复现
+    """
+
+    def __init__(self, max_workers: int = 4):
+        self.max_workers = max(1, max_workers)
+
+    def run(self, plan: List[Dict], execute: Callable, on_commit: Callable,
+            on_start: Optional[Callable] = None) -> List:
+        results = {}
+        remaining = {turn["id"]: len(turn["deps"]) for turn in plan}
+        dependents = {turn["id"]: [] for turn in plan}
+        for turn in plan:
+            for dep in turn["deps"]:
+                dependents[dep].append(turn["id"])
+
+        ready = [turn["id"] for turn in plan if remaining[turn["id"]] == 0]
+        running = {}
+        next_commit = 0
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while next_commit < len(plan):
+                # 按计划顺序提交所有已就绪的turn
+                for turn_id in sorted(ready):
+                    turn = plan[turn_id]
+                    history = [results[i] for i in turn["history"]]
+                    if on_start is not None:
+                        on_start(turn, history)
+                    running[pool.submit(execute, turn, history)] = turn_id
+                ready = []
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in sorted(finished, key=lambda f: running[f]):
+                    turn_id = running.pop(future)
+                    results[turn_id] = future.result()
+                    for child in dependents[turn_id]:
+                        remaining[child] -= 1
+                        if remaining[child] == 0:
+                            ready.append(child)
+
+                while next_commit in results:
+                    on_commit(plan[next_commit], results[next_commit])
+                    next_commit += 1
+
+        return [results[turn["id"]] for turn in plan]